@@ -0,0 +1,140 @@
+"""
+后台打开文档
+
+DocumentLoader 在后台线程中解密 .enc、用 fitz 解析，并按当前视口宽度先渲染好首页，
+结果通过信号交回界面线程。界面线程在解密期间保持响应，收到结果后首页立即显示，
+其余页面由页面视图在滚动到附近时渲染。
+
+同一个类也用于预取：打开树中的一个文件后，在空闲时依次处理其后的一两个同级文件，
+放入文档缓存池和页面缓存，点到下一个文件时直接显示。预取使用单独的实例，
+提交请求后先等待一段时间，让当前文档的页面先渲染；超出内存预算的文件不预取。
+点到正在预取的文件时（current 为该文件），界面线程直接等待预取结果，不再重复解密。
+
+每个实例只有一个线程、一次处理一个文件，新的请求会替换尚未开始的旧请求。
+"""
+import threading
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import enc_container
+import thumb_cache
+from page_view import render_page_image, fit_width_zoom
+
+PREFETCH_DELAY = 0.5  # 预取在提交请求后等待多久再开始（秒），避免与当前文档的首批渲染争抢
+
+# 后台打开的结果：各页尺寸和缩略图缓存键在后台一并算好，界面线程无需再逐页加载或读取文件
+LoadedDocument = namedtuple("LoadedDocument",
+                            ["doc_id", "doc", "buffer", "page_sizes", "first_page", "zoom", "doc_hash"])
+
+
+class DocumentLoader(QObject):
+    loaded = pyqtSignal(object)  # LoadedDocument
+    failed = pyqtSignal(str, str)  # (文档标识, 错误信息)
+    skipped = pyqtSignal(str)  # 文档标识：明文超过剩余内存预算，未打开
+
+    def __init__(self, key, memory_limit, delay=0.0, parent=None):
+        """key 为容器密钥；memory_limit 为解密时使用普通内存的上限（超过则使用匿名内存映射）；
+        delay 为提交请求后等待多久再开始（秒）"""
+        super().__init__(parent)
+        self.key = key
+        self.memory_limit = memory_limit
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._jobs = []  # [(文档标识, 加密文件路径), ...]
+        self._budget = None
+        self._viewport_width = 0
+        self._serial = 0
+        self._current = None  # 正在处理的文档标识
+        self._stopped = False
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def request(self, jobs, viewport_width, budget=None):
+        """提交 [(文档标识, 加密文件路径), ...]，替换尚未开始的请求
+
+        viewport_width 用于计算首页按宽度自适应时的缩放比例；
+        budget 为这批文件可使用的内存（字节），明文超过剩余预算的文件跳过，为 None 时不限制。
+        """
+        with self._cond:
+            self._jobs = list(jobs)
+            self._budget = budget
+            self._viewport_width = viewport_width
+            self._serial += 1
+            self._cond.notify_all()
+
+    @property
+    def current(self):
+        """正在处理的文档标识（已开始、结果尚未发出），没有时为 None；cancel() 不会中止它"""
+        with self._cond:
+            return self._current
+
+    def cancel(self):
+        with self._cond:
+            self._jobs = []
+            self._serial += 1
+            self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._jobs = []
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._jobs:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                if self.delay:
+                    # 等待一段时间，期间有新请求则重新计时
+                    serial = self._serial
+                    self._cond.wait(self.delay)
+                    if self._stopped:
+                        return
+                    if serial != self._serial or not self._jobs:
+                        continue
+                doc_id, enc_path = self._jobs.pop(0)
+                budget = self._budget
+                viewport_width = self._viewport_width
+                self._current = doc_id
+
+            try:
+                self._load(doc_id, enc_path, budget, viewport_width)
+            except Exception as e:
+                print(f"打开文件失败: {enc_path} ({str(e)})")
+                self.failed.emit(doc_id, str(e))
+            finally:
+                # 结果信号发出之后才清除，界面线程看到 current 为该文件时一定会收到结果
+                with self._cond:
+                    self._current = None
+
+    def _load(self, doc_id, enc_path, budget, viewport_width):
+        if budget is not None:
+            with enc_container.EncryptedReader(enc_path, self.key) as reader:
+                plain_size = reader.size
+            if plain_size > budget:
+                self.skipped.emit(doc_id)
+                return
+            with self._cond:
+                self._budget -= plain_size
+
+        buffer = enc_container.decrypt_to_buffer(enc_path, self.key, self.memory_limit)
+        if not len(buffer):
+            raise ValueError("解密后文件为空")
+        doc = fitz.open(stream=memoryview(buffer), filetype="pdf")
+        page_sizes = [(page.rect.width, page.rect.height) for page in doc]
+        image = None
+        zoom = 0.0
+        if page_sizes:
+            zoom = fit_width_zoom(page_sizes, viewport_width)
+            image = render_page_image(doc, 0, zoom)
+        try:
+            doc_hash = thumb_cache.document_key(enc_path)
+        except OSError as e:
+            print(f"计算缩略图缓存键失败: {enc_path} ({str(e)})")
+            doc_hash = None
+        self.loaded.emit(LoadedDocument(doc_id, doc, buffer, page_sizes, image, zoom, doc_hash))
@@ -0,0 +1,69 @@
+"""
+最近打开文档的缓存池
+
+保存最近打开的几个 fitz.Document 及其解密缓冲区（明文只在内存中），在树中切回这些文件时
+无需重新解密和解析。超出个数或内存上限时按最近使用顺序关闭最久未用的文档，
+当前正在显示的文档不会被关闭。
+"""
+from collections import OrderedDict
+
+
+def close_document(doc, buffer):
+    """关闭文档并释放解密缓冲区"""
+    if doc is not None:
+        doc.close()
+    if buffer is not None and hasattr(buffer, "close"):
+        try:
+            buffer.close()
+        except BufferError:
+            # 仍有页面对象引用该缓冲区时，交给垃圾回收释放
+            pass
+
+
+class DocumentPool:
+    def __init__(self, max_docs, max_mb):
+        """max_docs 为最多保留的文档个数，max_mb 为解密缓冲区的总大小上限（MB）"""
+        self.max_docs = max(1, max_docs)
+        self.budget = max_mb * 1024 * 1024
+        self.used = 0
+        self.active = None  # 正在显示的文档，淘汰时跳过
+        self._items = OrderedDict()  # 文档标识 -> (doc, buffer, 各页尺寸或None)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        """返回 (doc, buffer, 各页尺寸或None) 或 None，命中时标记为最近使用"""
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key, doc, buffer, page_sizes=None):
+        """加入一个已打开的文档（由缓存池负责关闭），必要时淘汰最久未用的文档"""
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._close(old)
+        self._items[key] = (doc, buffer, page_sizes)
+        self.used += len(buffer)
+        self.evict()
+
+    def set_active(self, key):
+        self.active = key
+
+    def evict(self):
+        for key in list(self._items):
+            if len(self._items) <= self.max_docs and self.used <= self.budget:
+                break
+            if key != self.active:
+                self._close(self._items.pop(key))
+
+    def clear(self):
+        while self._items:
+            self._close(self._items.popitem(last=False)[1])
+        self.active = None
+
+    def _close(self, item):
+        doc, buffer, _ = item
+        self.used -= len(buffer)
+        close_document(doc, buffer)
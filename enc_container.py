@@ -0,0 +1,275 @@
+"""
+加密文件容器格式（.enc），供加密工具 generate_gui.py 与查看器 pdfviewer.py 共用。
+
+v1 布局：
+  头部（32字节）：魔数(8) | 版本(1) | 标志(1) | 保留(2) | 块大小(4) | 明文大小(8) | nonce前缀(8)
+  密文块：明文按块大小切分，每块单独用 AES-GCM 加密，密文长度 = 明文长度 + 16字节认证标签
+
+第 i 块的 nonce 为 nonce前缀 + i（4字节大端），附加认证数据为整个头部，
+因此数据块不能被调换、截断或移植到其他文件。块大小固定，第 i 块的偏移可直接算出，
+无需单独存放块索引，读取任意位置只需解密对应的块。
+
+旧版 .enc 是整个PDF的Base64编码（以 "JVBER" 开头），不会与魔数冲突，读取时自动识别。
+"""
+import io
+import os
+import mmap
+import base64
+import hashlib
+import secrets
+import struct
+from collections import OrderedDict, namedtuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+MAGIC = b"\x89PDFENC\n"
+VERSION = 1
+HEADER_FORMAT = ">8sBBHIQ8s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+CHUNK_SIZE = 1024 * 1024  # 默认每块1MiB明文
+
+FORMAT_CONTAINER = "aesgcm"
+FORMAT_BASE64 = "base64"
+
+# 随机读取旧版Base64文件时每块对应的明文大小（必须是3的整数倍）
+LEGACY_CHUNK_SIZE = 3 * 256 * 1024
+# EncryptedReader 默认缓存的已解密数据块个数
+READER_CACHE_CHUNKS = 4
+
+ContainerHeader = namedtuple("ContainerHeader", ["chunk_size", "plain_size", "nonce_prefix", "raw"])
+
+
+def derive_key(secret):
+    """由程序内置密钥派生出32字节的容器加密密钥"""
+    return hashlib.sha256(f"pdf-enc-container|{secret}".encode()).digest()
+
+
+def pack_header(chunk_size, plain_size, nonce_prefix):
+    raw = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, 0, chunk_size, plain_size, nonce_prefix)
+    return ContainerHeader(chunk_size, plain_size, nonce_prefix, raw)
+
+
+def parse_header(raw):
+    """解析容器头部，格式不对时抛出 ValueError"""
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError("不是有效的加密容器文件")
+    magic, version, flags, reserved, chunk_size, plain_size, nonce_prefix = struct.unpack(
+        HEADER_FORMAT, raw[:HEADER_SIZE])
+    if version != VERSION:
+        raise ValueError(f"不支持的加密容器版本: {version}")
+    if chunk_size <= 0:
+        raise ValueError("加密容器头部已损坏")
+    return ContainerHeader(chunk_size, plain_size, nonce_prefix, bytes(raw[:HEADER_SIZE]))
+
+
+def chunk_count(header):
+    return (header.plain_size + header.chunk_size - 1) // header.chunk_size
+
+
+def chunk_offset(header, index):
+    """第 index 块密文在文件中的偏移"""
+    return HEADER_SIZE + index * (header.chunk_size + TAG_SIZE)
+
+
+def chunk_nonce(header, index):
+    return header.nonce_prefix + struct.pack(">I", index)
+
+
+def container_size(header):
+    """按头部信息计算完整容器文件应有的大小"""
+    return HEADER_SIZE + header.plain_size + chunk_count(header) * TAG_SIZE
+
+
+def encrypt_file(src_path, dst_path, key, chunk_size=CHUNK_SIZE, hasher=None):
+    """把文件流式加密为分块容器，内存占用只与块大小有关
+
+    传入 hasher（如 hashlib.sha256()）时顺带计算源文件摘要。
+    """
+    aesgcm = AESGCM(key)
+    # 先写入临时文件再替换，避免中途失败留下不完整的加密文件
+    tmp_path = dst_path + ".part"
+    try:
+        with open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+            plain_size = os.fstat(src.fileno()).st_size
+            header = pack_header(chunk_size, plain_size, secrets.token_bytes(8))
+            dst.write(header.raw)
+
+            index = 0
+            written = 0
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > plain_size:
+                    break
+                if hasher is not None:
+                    hasher.update(chunk)
+                dst.write(aesgcm.encrypt(chunk_nonce(header, index), chunk, header.raw))
+                index += 1
+
+            if written != plain_size:
+                raise ValueError("源文件在加密过程中被修改")
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def decrypt_chunk(aesgcm, header, index, data):
+    """解密并校验单个数据块"""
+    try:
+        return aesgcm.decrypt(chunk_nonce(header, index), bytes(data), header.raw)
+    except InvalidTag:
+        raise ValueError(f"第 {index + 1} 个数据块校验失败，文件已损坏或被篡改")
+
+
+def seal(key, data, aad=b""):
+    """用 AES-GCM 一次性加密一小段数据（如缩略图），返回 nonce(12) + 密文"""
+    nonce = secrets.token_bytes(12)
+    return nonce + AESGCM(key).encrypt(nonce, data, aad)
+
+
+def unseal(key, blob, aad=b""):
+    """解密 seal() 的结果，校验失败时抛出 ValueError"""
+    try:
+        return AESGCM(key).decrypt(blob[:12], blob[12:], aad)
+    except InvalidTag:
+        raise ValueError("数据校验失败，已损坏或被篡改")
+
+
+class EncryptedReader(io.RawIOBase):
+    """.enc 文件的只读、可随机访问的明文视图
+
+    只解密实际读到的数据块，并缓存最近用过的几块，内存占用与文件大小无关。
+    同时支持新版分块容器和旧版Base64文件（Base64每4字节对应3字节明文，同样可以按块定位）。
+    """
+
+    def __init__(self, path, key, cache_chunks=READER_CACHE_CHUNKS):
+        super().__init__()
+        self.name = path
+        self._file = open(path, "rb")
+        self._pos = 0
+        self._cache = OrderedDict()
+        self._cache_chunks = max(1, cache_chunks)
+        self._legacy_data = None
+        try:
+            file_size = os.fstat(self._file.fileno()).st_size
+            if self._file.read(len(MAGIC)) == MAGIC:
+                self.format = FORMAT_CONTAINER
+                self._file.seek(0)
+                self._header = parse_header(self._file.read(HEADER_SIZE))
+                if file_size != container_size(self._header):
+                    raise ValueError("加密文件长度不正确，可能已被截断")
+                self._aesgcm = AESGCM(key)
+                self.chunk_size = self._header.chunk_size
+                self.size = self._header.plain_size
+            else:
+                self.format = FORMAT_BASE64
+                self.chunk_size = LEGACY_CHUNK_SIZE
+                self._file.seek(0)
+                if file_size % 4:
+                    # 含换行等非标准内容的旧文件无法按块定位，只能整体解码
+                    self._legacy_data = base64.b64decode(self._file.read())
+                    self.size = len(self._legacy_data)
+                elif file_size:
+                    self._file.seek(file_size - 2)
+                    self.size = file_size // 4 * 3 - self._file.read(2).count(b"=")
+                else:
+                    self.size = 0
+        except BaseException:
+            self._file.close()
+            raise
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"不支持的 whence 参数: {whence}")
+        if pos < 0:
+            raise ValueError("偏移不能为负数")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        total = 0
+        while total < len(view) and self._pos < self.size:
+            index, start = divmod(self._pos, self.chunk_size)
+            chunk = self._get_chunk(index)
+            n = min(len(chunk) - start, len(view) - total)
+            view[total:total + n] = chunk[start:start + n]
+            total += n
+            self._pos += n
+        return total
+
+    def _get_chunk(self, index):
+        chunk = self._cache.get(index)
+        if chunk is not None:
+            self._cache.move_to_end(index)
+            return chunk
+
+        chunk = self._load_chunk(index)
+        self._cache[index] = chunk
+        if len(self._cache) > self._cache_chunks:
+            self._cache.popitem(last=False)
+        return chunk
+
+    def _load_chunk(self, index):
+        if self.format == FORMAT_CONTAINER:
+            self._file.seek(chunk_offset(self._header, index))
+            data = self._file.read(self._header.chunk_size + TAG_SIZE)
+            return decrypt_chunk(self._aesgcm, self._header, index, data)
+
+        if self._legacy_data is not None:
+            start = index * self.chunk_size
+            return self._legacy_data[start:start + self.chunk_size]
+
+        encoded_size = self.chunk_size // 3 * 4
+        self._file.seek(index * encoded_size)
+        return base64.b64decode(self._file.read(encoded_size))
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            self._cache.clear()
+            self._legacy_data = None
+        super().close()
+
+
+def decrypt_to_buffer(path, key, memory_limit):
+    """把 .enc 文件完整解密到内存缓冲区，明文不落盘
+
+    明文不超过 memory_limit 字节时使用 bytearray，否则使用匿名内存映射
+    （由系统按需换页，关闭后立即归还内存）。返回的缓冲区可包成 memoryview
+    交给 fitz.open(stream=...)，不会再复制一次。
+    """
+    with EncryptedReader(path, key) as reader:
+        if reader.size <= memory_limit:
+            buffer = bytearray(reader.size)
+        else:
+            buffer = mmap.mmap(-1, reader.size)
+        with memoryview(buffer) as view:
+            filled = 0
+            while filled < reader.size:
+                n = reader.readinto(view[filled:])
+                if not n:
+                    raise ValueError("加密文件内容不完整")
+                filled += n
+    return buffer
@@ -0,0 +1,98 @@
+"""
+本机模拟 NTP 服务
+
+在 127.0.0.1 上启动若干个模拟 NTP 服务器（每个可以设定时钟偏差，或者不回复），
+然后用 trusted_time.run_quorum 对它们做一次法定数同步并输出结果，用来离线检查同步逻辑：
+
+    python fake_ntp.py                    # 三个服务器都偏快 2 秒，应采用约 +2 秒的偏差
+    python fake_ntp.py 0 0.2 300          # 第三个服务器偏差太大，前两个达成一致
+    python fake_ntp.py 5 mute mute        # 只有一个服务器回复，达不到法定数，超时后返回
+"""
+import argparse
+import asyncio
+import struct
+import threading
+import time
+
+from trusted_time import NTP_PACKET_FORMAT, NTP_QUORUM, NTP_TIMEOUT, NTP_TOLERANCE, run_quorum, to_ntp_time
+
+FAKE_HOST = "127.0.0.1"
+FAKE_OFFSETS = ["2", "2", "2"]
+
+
+class FakeNtpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, offset):
+        self.offset = offset  # 相对本机时钟的偏差（秒），None 表示不回复
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.offset is None or len(data) < 48:
+            return
+        received = to_ntp_time(time.time() + self.offset)
+        request = struct.unpack(NTP_PACKET_FORMAT, data[:48])
+        words = [0] * 12
+        words[0] = (4 << 27) | (4 << 24) | (2 << 16)  # 版本4，服务器模式，stratum 2
+        words[6:8] = request[10:12]  # Originate Timestamp：原样带回客户端的发送时间
+        words[8:10] = received
+        words[10:12] = to_ntp_time(time.time() + self.offset)
+        self.transport.sendto(struct.pack(NTP_PACKET_FORMAT, *words), addr)
+
+
+def parse_offset(text):
+    return None if text == "mute" else float(text)
+
+
+async def start_servers(offsets, host=FAKE_HOST):
+    """在随机端口上启动模拟服务器，返回 ([传输], [(主机, 端口)])"""
+    loop = asyncio.get_running_loop()
+    transports = []
+    servers = []
+    for offset in offsets:
+        transport, _ = await loop.create_datagram_endpoint(lambda offset=offset: FakeNtpProtocol(offset),
+                                                           local_addr=(host, 0))
+        transports.append(transport)
+        servers.append(transport.get_extra_info("sockname")[:2])
+    return transports, servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在本机启动模拟NTP服务器，并用可信时间服务对它们同步一次")
+    parser.add_argument("offsets", nargs="*", default=FAKE_OFFSETS,
+                        help="每个服务器的时钟偏差（秒），写 mute 表示不回复")
+    parser.add_argument("--quorum", type=int, default=NTP_QUORUM, help="法定数")
+    parser.add_argument("--tolerance", type=float, default=NTP_TOLERANCE, help="结果一致的判定范围（秒）")
+    parser.add_argument("--timeout", type=float, default=NTP_TIMEOUT, help="同步超时（秒）")
+    args = parser.parse_args()
+
+    offsets = [parse_offset(offset) for offset in args.offsets]
+    loop = asyncio.new_event_loop()
+    transports, servers = loop.run_until_complete(start_servers(offsets))
+    for (host, port), offset in zip(servers, offsets):
+        print(f"模拟服务器 {host}:{port} 偏差: {'不回复' if offset is None else f'{offset:+g} 秒'}")
+
+    # 模拟服务器的事件循环在后台线程中运行，同步在当前线程中进行，与查看器中的用法一致
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        start_time = time.perf_counter()
+        result = run_quorum(servers, timeout=args.timeout, quorum=args.quorum, tolerance=args.tolerance)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        for transport in transports:
+            loop.call_soon_threadsafe(transport.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    if result is None:
+        print(f"\n未达到法定数（用时 {elapsed:.2f} 秒）")
+    else:
+        offset, agreed = result
+        print(f"\n采用偏差 {offset:+.3f} 秒，一致的服务器: {', '.join(agreed)}（用时 {elapsed:.2f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,232 @@
 import os
+import json
 import base64
 import hashlib
 import datetime
 import uuid
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import pyperclip
+import fitz  # PyMuPDF
+
+import enc_container
+import thumb_cache
+import tree_index
+
+# 授权码密钥（需与查看器 pdfviewer.py 保持一致），加密容器的密钥也由它派生
+SECRET_KEY = "MySecretKey123"
+CODE_LENGTH = 24
+CONTAINER_KEY = enc_container.derive_key(SECRET_KEY)
+
+# 加密格式选项（界面显示名 -> 格式）
+ENCRYPT_FORMATS = {
+    "AES-GCM分块加密": enc_container.FORMAT_CONTAINER,
+    "Base64（兼容旧版查看器）": enc_container.FORMAT_BASE64,
+}
+
+# 界面轮询后台事件队列的间隔（毫秒）
+POLL_INTERVAL_MS = 100
+
+# 流式编码的分块大小（必须是3的整数倍，分块编码结果才能与整块编码逐字节一致）
+ENCODE_CHUNK_SIZE = 3 * 1024 * 1024
+
+# 增量加密清单：保存在加密目录旁（如 encrypted_files.manifest.json），不会随加密目录一起打包分发
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def encode_file_base64(src_path, dst_path, chunk_size=ENCODE_CHUNK_SIZE, hasher=None):
+    """按固定大小分块流式Base64编码，内存占用与文件大小无关
+
+    传入 hasher（如 hashlib.sha256()）时顺带计算源文件摘要，无需再读一遍文件。
+    """
+    if chunk_size <= 0 or chunk_size % 3:
+        raise ValueError("分块大小必须是3的正整数倍")
+
+    # 先写入临时文件再替换，避免中途失败留下不完整的加密文件
+    tmp_path = dst_path + ".part"
+    try:
+        with open(src_path, "rb") as src, open(tmp_path, "wb") as dst:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                if hasher is not None:
+                    hasher.update(chunk)
+                dst.write(base64.b64encode(chunk))
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def hash_file(path, chunk_size=ENCODE_CHUNK_SIZE):
+    """分块计算文件的SHA-256"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_manifest_path(enc_folder):
+    """获取加密目录对应的增量清单路径"""
+    return os.path.abspath(enc_folder).rstrip("\\/") + MANIFEST_SUFFIX
+
+
+def load_manifest(manifest_path):
+    """读取增量清单，文件不存在或损坏时返回空清单"""
+    try:
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return data
+    except Exception as e:
+        print(f"读取增量清单失败: {str(e)}")
+    return {"version": MANIFEST_VERSION, "source": "", "files": {}}
+
+
+def save_manifest(manifest_path, manifest):
+    """保存增量清单（先写临时文件再替换，避免中断后清单损坏）"""
+    tmp_path = manifest_path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def make_manifest_entry(stat_result, digest, fmt, pages):
+    return {"size": stat_result.st_size, "mtime": stat_result.st_mtime_ns, "sha256": digest, "format": fmt,
+            "pages": pages}
+
+
+def count_pages(path):
+    """PDF的页数（写入目录索引），无法解析时返回 None，不影响加密"""
+    try:
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+
+def write_tree_index(enc_folder, files):
+    """按加密目录的实际内容生成目录索引，文件的大小和页数取自清单记录"""
+    def file_info(key):
+        entry = files.get(key)
+        if entry is None or entry.get("size", -1) < 0:
+            return None, None
+        return entry["size"], entry.get("pages")
+
+    tree_index.write_index(enc_folder, CONTAINER_KEY, tree_index.scan_tree(enc_folder, file_info))
+
+
+def is_unchanged(stat_result, entry, fmt):
+    """大小、修改时间和加密格式都与清单一致时，视为未变化（无需读取文件内容）"""
+    return (entry is not None
+            and entry.get("format", enc_container.FORMAT_BASE64) == fmt
+            and entry.get("size") == stat_result.st_size
+            and entry.get("mtime") == stat_result.st_mtime_ns)
+
+
+def remove_output(enc_path, enc_folder):
+    """删除加密文件及其预览文件，并清理随之变空的上级目录（不超出加密目录）"""
+    for path in (enc_path, thumb_cache.get_preview_path(enc_path)):
+        if os.path.exists(path):
+            os.remove(path)
+    enc_root = os.path.abspath(enc_folder)
+    parent = os.path.dirname(os.path.abspath(enc_path))
+    while parent != enc_root and parent.startswith(enc_root) and not os.listdir(parent):
+        os.rmdir(parent)
+        parent = os.path.dirname(parent)
+
+
+def encrypt_one(task):
+    """加密单个文件（可在子进程中运行），出错时返回错误信息而不抛出异常
+
+    task 为 (源文件, 加密文件, 清单中的旧记录或None, 加密格式, 是否生成预览文件)，
+    返回 (源文件, 状态, 详情, 警告)：状态为 "encrypted"/"skipped" 时详情是新的清单记录，
+    为 "failed" 时详情是错误信息；预览文件是可选的，生成失败只作为警告返回，不影响加密结果。
+    """
+    src_path, enc_path, old_entry, fmt, with_preview = task
+    try:
+        stat_result = os.stat(src_path)
+
+        # 只改了修改时间、内容未变的文件（如重新复制过来的）比较摘要后跳过
+        if (old_entry is not None and old_entry.get("format", enc_container.FORMAT_BASE64) == fmt
+                and old_entry.get("size") == stat_result.st_size
+                and os.path.exists(enc_path) and hash_file(src_path) == old_entry.get("sha256")):
+            status = "skipped"
+            pages = old_entry.get("pages")
+            entry = make_manifest_entry(stat_result, old_entry["sha256"], fmt,
+                                        pages if pages is not None else count_pages(src_path))
+        else:
+            os.makedirs(os.path.dirname(enc_path), exist_ok=True)
+            hasher = hashlib.sha256()
+            if fmt == enc_container.FORMAT_CONTAINER:
+                enc_container.encrypt_file(src_path, enc_path, CONTAINER_KEY, hasher=hasher)
+            else:
+                encode_file_base64(src_path, enc_path, hasher=hasher)
+            status = "encrypted"
+            entry = make_manifest_entry(stat_result, hasher.hexdigest(), fmt, count_pages(src_path))
+
+        warning = None
+        preview_path = thumb_cache.get_preview_path(enc_path)
+        if with_preview and (status == "encrypted" or not os.path.exists(preview_path)):
+            try:
+                thumb_cache.write_preview(src_path, enc_path, CONTAINER_KEY)
+            except Exception as e:
+                warning = f"生成预览文件失败，已跳过: {str(e)}"
+                # 记下失败，文件不变时下次不再重试
+                entry["preview_failed"] = True
+                if os.path.exists(preview_path):
+                    os.remove(preview_path)
+        elif not with_preview and status == "encrypted" and os.path.exists(preview_path):
+            # 旧的预览文件已与新加密文件不匹配
+            os.remove(preview_path)
+        return src_path, status, entry, warning
+    except Exception as e:
+        return src_path, "failed", str(e), None
+
+
+def encrypt_files(tasks, workers=1, cancel_event=None):
+    """按任务顺序逐个返回 encrypt_one 的结果；workers大于1时用多进程并行加密
+
+    cancel_event 被置位后不再返回新结果，尚未开始的任务会被取消。
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            yield encrypt_one(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(encrypt_one, task) for task in tasks]
+        try:
+            # 按提交顺序取结果，状态日志与文件遍历顺序一致
+            for future in futures:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
 
 
 class PDFEncryptorAndAuthTool:
     def __init__(self, root):
         self.root = root
         self.root.title("PDF加密与授权码工具")
-        self.root.geometry("650x500")
+        self.root.geometry("650x540")
         self.root.resizable(True, True)
 
         # 设置中文字体支持
@@ -65,24 +279,86 @@ class PDFEncryptorAndAuthTool:
             command=self.select_enc_dir
         ).grid(row=1, column=2, padx=5, pady=10)
 
+        # 并行进程数
+        ttk.Label(self.encrypt_frame, text="并行进程数:").grid(row=2, column=0, padx=5, pady=10, sticky=tk.W)
+
+        # 进程数、增量选项和加密格式放在同一行，从左到右排列
+        options_frame = ttk.Frame(self.encrypt_frame)
+        options_frame.grid(row=2, column=1, padx=5, pady=10, sticky=tk.W)
+
+        self.workers_var = tk.StringVar(value=str(os.cpu_count() or 1))
+        ttk.Entry(options_frame, textvariable=self.workers_var, width=10).pack(side=tk.LEFT)
+
+        # 增量加密：跳过内容未变化的文件，并清理源文件已删除的加密文件
+        self.incremental_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            options_frame,
+            text="仅加密有变化的文件",
+            variable=self.incremental_var
+        ).pack(side=tk.LEFT, padx=10)
+
+        # 加密格式
+        self.format_var = tk.StringVar(value=next(iter(ENCRYPT_FORMATS)))
+        ttk.Combobox(
+            options_frame,
+            textvariable=self.format_var,
+            values=list(ENCRYPT_FORMATS),
+            state="readonly",
+            width=24
+        ).pack(side=tk.LEFT, padx=5)
+
+        # 生成预览文件（首页预览图和缩略图，查看器打开文档时无需解密整个PDF即可显示）
+        self.preview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.encrypt_frame,
+            text="生成首页预览和缩略图",
+            variable=self.preview_var
+        ).grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+
         # 状态显示区域
-        ttk.Label(self.encrypt_frame, text="处理状态:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.NW)
+        ttk.Label(self.encrypt_frame, text="处理状态:").grid(row=4, column=0, padx=5, pady=5, sticky=tk.NW)
 
         self.status_text = tk.Text(self.encrypt_frame, height=15, width=60)
-        self.status_text.grid(row=2, column=1, padx=5, pady=5)
+        self.status_text.grid(row=4, column=1, padx=5, pady=5)
         scrollbar = ttk.Scrollbar(
             self.encrypt_frame,
             command=self.status_text.yview
         )
-        scrollbar.grid(row=2, column=2, sticky=tk.NS)
+        scrollbar.grid(row=4, column=2, sticky=tk.NS)
         self.status_text.config(yscrollcommand=scrollbar.set)
 
-        # 加密按钮
-        ttk.Button(
-            self.encrypt_frame,
+        # 进度条与速度/剩余时间
+        self.progress_bar = ttk.Progressbar(self.encrypt_frame, mode="determinate", length=420)
+        self.progress_bar.grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
+
+        self.progress_var = tk.StringVar()
+        ttk.Label(self.encrypt_frame, textvariable=self.progress_var).grid(row=6, column=1, padx=5, pady=5,
+                                                                          sticky=tk.W)
+
+        # 加密/取消按钮
+        button_frame = ttk.Frame(self.encrypt_frame)
+        button_frame.grid(row=7, column=1, padx=5, pady=20)
+
+        self.start_btn = ttk.Button(
+            button_frame,
             text="开始加密",
             command=self.start_encryption
-        ).grid(row=3, column=1, padx=5, pady=20)
+        )
+        self.start_btn.pack(side=tk.LEFT, padx=5)
+
+        self.cancel_btn = ttk.Button(
+            button_frame,
+            text="取消",
+            command=self.cancel_encryption,
+            state=tk.DISABLED
+        )
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+
+        # 后台加密线程与界面之间的事件队列
+        self.event_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker_thread = None
+        self.started_at = 0.0
 
     def init_auth_tab(self):
         # 机器码输入
@@ -148,7 +424,10 @@ class PDFEncryptorAndAuthTool:
         self.root.update_idletasks()
 
     def start_encryption(self):
-        """开始加密PDF文件"""
+        """开始加密PDF文件（在后台线程中执行，界面保持响应）"""
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+
         src_folder = self.src_dir_var.get()
         enc_folder = self.enc_dir_var.get()
 
@@ -160,46 +439,211 @@ class PDFEncryptorAndAuthTool:
             messagebox.showerror("错误", f"源目录不存在: {src_folder}")
             return
 
+        try:
+            workers = int(self.workers_var.get().strip())
+            if workers <= 0:
+                raise ValueError("并行进程数必须为正整数")
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的并行进程数（正整数）")
+            return
+
         # 清空状态区域
         self.status_text.delete(1.0, tk.END)
         self.log(f"开始加密，源目录: {src_folder}")
         self.log(f"加密文件将保存到: {enc_folder}")
 
+        self.progress_bar.config(value=0, maximum=1)
+        self.progress_var.set("正在扫描源目录...")
+        self.start_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.NORMAL)
+
+        self.cancel_event.clear()
+        self.started_at = time.monotonic()
+        self.worker_thread = threading.Thread(
+            target=self.run_encryption,
+            args=(src_folder, enc_folder, workers, self.incremental_var.get(),
+                  ENCRYPT_FORMATS[self.format_var.get()], self.preview_var.get()),
+            daemon=True
+        )
+        self.worker_thread.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def cancel_encryption(self):
+        """请求取消正在进行的加密"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.progress_var.set("正在取消，等待进行中的文件完成...")
+
+    def run_encryption(self, src_folder, enc_folder, workers, incremental=True,
+                       fmt=enc_container.FORMAT_CONTAINER, with_preview=False):
+        """后台线程：执行加密，通过事件队列向界面报告进度（不直接操作Tk控件）"""
+        events = self.event_queue
         try:
             # 创建加密目录
             os.makedirs(enc_folder, exist_ok=True)
 
-            pdf_count = 0
-            # 遍历源目录
+            # 读取上次的增量清单；源目录变了则旧记录不可用
+            manifest_path = get_manifest_path(enc_folder)
+            manifest = load_manifest(manifest_path)
+            source = os.path.abspath(src_folder)
+            if manifest["source"] != source:
+                if manifest["files"]:
+                    events.put(("log", "源目录与上次不同，将重新加密全部文件"))
+                manifest = {"version": MANIFEST_VERSION, "source": source, "files": {}}
+            old_files = manifest["files"]
+            new_files = {}
+
+            # 遍历源目录，收集待加密文件（保持目录结构）
+            tasks = []
+            task_keys = []
+            skipped_count = 0
             for root, dirs, files in os.walk(src_folder):
-                for fname in files:
+                dirs.sort()
+                for fname in sorted(files):
                     if fname.lower().endswith(".pdf"):
-                        pdf_count += 1
                         full_path = os.path.join(root, fname)
-                        self.log(f"处理文件: {full_path}")
-
-                        # 读取文件内容
-                        with open(full_path, "rb") as f:
-                            data = f.read()
-
-                        # Base64加密
-                        enc_data = base64.b64encode(data)
-
-                        # 保持目录结构
                         rel_path = os.path.relpath(full_path, src_folder)
                         enc_path = os.path.join(enc_folder, rel_path + ".enc")
-                        os.makedirs(os.path.dirname(enc_path), exist_ok=True)
-
-                        # 保存加密文件
-                        with open(enc_path, "wb") as f:
-                            f.write(enc_data)
-
-            self.log(f"加密完成，共处理 {pdf_count} 个PDF文件")
-            messagebox.showinfo("成功", f"加密完成，共处理 {pdf_count} 个PDF文件")
+                        key = rel_path.replace(os.sep, "/")
+                        old_entry = old_files.get(key) if incremental else None
+
+                        # 大小和修改时间未变且加密文件（及需要的预览文件）存在，直接沿用旧记录
+                        if (is_unchanged(os.stat(full_path), old_entry, fmt) and os.path.exists(enc_path)
+                                and (not with_preview or old_entry.get("preview_failed")
+                                     or os.path.exists(thumb_cache.get_preview_path(enc_path)))):
+                            if "pages" not in old_entry:
+                                # 旧版清单没有页数，补上一次（只解析PDF结构，不渲染）
+                                old_entry = dict(old_entry, pages=count_pages(full_path))
+                            new_files[key] = old_entry
+                            skipped_count += 1
+                            continue
+
+                        tasks.append((full_path, enc_path, old_entry, fmt, with_preview))
+                        task_keys.append(key)
+
+            # 清理源文件已删除的加密文件
+            pending_keys = set(task_keys)
+            pruned_count = 0
+            for key in old_files:
+                if key not in new_files and key not in pending_keys:
+                    enc_path = os.path.join(enc_folder, *key.split("/")) + ".enc"
+                    try:
+                        remove_output(enc_path, enc_folder)
+                        pruned_count += 1
+                        events.put(("log", f"删除过期加密文件: {enc_path}"))
+                    except Exception as e:
+                        events.put(("log", f"删除过期加密文件失败: {enc_path} ({str(e)})"))
+
+            pdf_count = len(tasks)
+            if skipped_count:
+                events.put(("log", f"{skipped_count} 个文件未变化，已跳过"))
+            events.put(("total", pdf_count))
+
+            done_count = 0
+            failed_count = 0
+            try:
+                # 单个文件失败只记录日志，不影响其余文件
+                results = encrypt_files(tasks, workers, self.cancel_event)
+                for key, (full_path, status, detail, warning) in zip(task_keys, results):
+                    done_count += 1
+                    if status == "failed":
+                        failed_count += 1
+                        # 保留一条必然失配的记录：下次会重试，源文件删除后也能被清理
+                        new_files[key] = {"size": -1, "mtime": -1, "sha256": ""}
+                        events.put(("log", f"加密失败: {full_path} ({detail})"))
+                    else:
+                        new_files[key] = detail
+                        if status == "skipped":
+                            skipped_count += 1
+                        else:
+                            events.put(("log", f"处理文件: {full_path}"))
+                    if warning:
+                        events.put(("log", f"{full_path}: {warning}"))
+                    events.put(("progress", done_count))
+            finally:
+                # 取消时未处理的文件保留旧记录，下次运行会重新检查
+                if self.cancel_event.is_set():
+                    for key, (full_path, enc_path, old_entry, _, _) in zip(task_keys[done_count:], tasks[done_count:]):
+                        if old_entry is not None:
+                            new_files[key] = old_entry
+                manifest["files"] = new_files
+                save_manifest(manifest_path, manifest)
+
+            # 目录索引随加密目录一起分发，查看器据此直接建立目录树
+            try:
+                write_tree_index(enc_folder, new_files)
+                events.put(("log", f"已生成目录索引: {tree_index.get_index_path(enc_folder)}"))
+            except Exception as e:
+                events.put(("log", f"生成目录索引失败: {str(e)}"))
+
+            if self.cancel_event.is_set() and done_count < pdf_count:
+                summary = f"加密已取消，已处理 {done_count}/{pdf_count} 个PDF文件"
+                status = "cancelled"
+            else:
+                summary = f"加密完成，共处理 {pdf_count} 个PDF文件"
+                status = "done"
+            if skipped_count:
+                summary += f"，跳过 {skipped_count} 个未变化文件"
+            if pruned_count:
+                summary += f"，删除 {pruned_count} 个过期文件"
+            if failed_count:
+                summary += f"，其中 {failed_count} 个失败"
+            events.put((status, summary))
         except Exception as e:
-            error_msg = f"加密过程出错: {str(e)}"
-            self.log(error_msg)
-            messagebox.showerror("错误", error_msg)
+            events.put(("error", f"加密过程出错: {str(e)}"))
+
+    def poll_events(self):
+        """定时取出后台事件，批量写入状态区域并刷新进度"""
+        lines = []
+        finished = None
+        while True:
+            try:
+                event = self.event_queue.get_nowait()
+            except queue.Empty:
+                break
+            kind, value = event
+            if kind == "log":
+                lines.append(value)
+            elif kind == "total":
+                self.progress_bar.config(maximum=max(value, 1))
+            elif kind == "progress":
+                self.progress_bar.config(value=value)
+                self.update_progress_text(value)
+            else:
+                lines.append(value)
+                finished = event
+
+        # 一次插入整批日志，避免逐行刷新界面
+        if lines:
+            self.status_text.insert(tk.END, "\n".join(lines) + "\n")
+            self.status_text.see(tk.END)
+
+        if finished is None:
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+            return
+
+        self.start_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+        kind, message = finished
+        self.progress_var.set(message)
+        if kind == "done":
+            messagebox.showinfo("成功", message)
+        elif kind == "cancelled":
+            messagebox.showwarning("已取消", message)
+        else:
+            messagebox.showerror("错误", message)
+
+    def update_progress_text(self, done_count):
+        """显示已处理数量、处理速度和预计剩余时间"""
+        total = int(self.progress_bar.cget("maximum"))
+        elapsed = time.monotonic() - self.started_at
+        rate = done_count / elapsed if elapsed > 0 else 0.0
+        if rate > 0:
+            remaining = int((total - done_count) / rate)
+            eta = f"{remaining // 60:02d}:{remaining % 60:02d}"
+        else:
+            eta = "--:--"
+        self.progress_var.set(f"已处理 {done_count}/{total} | {rate:.1f} 个/秒 | 预计剩余 {eta}")
 
     def generate_default_machine_code(self):
         """生成默认机器码（基于设备MAC地址）"""
@@ -222,9 +666,6 @@ class PDFEncryptorAndAuthTool:
             return
 
         # 生成授权码
-        SECRET_KEY = "MySecretKey123"
-        CODE_LENGTH = 24
-
         expire_date = datetime.datetime.now() + datetime.timedelta(days=valid_days)
         expire_str = expire_date.strftime("%Y%m%d")
         data = f"{machine_code}|{expire_str}"
@@ -246,6 +687,8 @@ class PDFEncryptorAndAuthTool:
 
 
 if __name__ == "__main__":
+    # 打包为exe后子进程需要此调用才能正常启动进程池
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = PDFEncryptorAndAuthTool(root)
     root.mainloop()
\ No newline at end of file
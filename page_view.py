@@ -0,0 +1,668 @@
+"""
+PDF 页面视图（虚拟化）
+
+整个文档只用一个画布控件绘制：视口内及附近的页面才渲染成图像，
+其余页面按 page.rect 计算大小、画成占位框；滚出一定范围的页面释放图像。
+打开大文档时无需先渲染全部页面，内存占用与页数无关。
+
+页面由 RenderService 在后台线程中渲染，线程各自打开一个 fitz.Document，
+渲染好的 QImage 通过信号送回界面线程，并存入按 (文档, 页码, 缩放) 索引的 PageCache，
+回到之前的缩放比例或重新打开最近看过的文档时无需重新渲染。
+注意 PyMuPDF 在 get_pixmap 期间一直持有GIL，渲染线程运行时界面线程同样会停顿；
+后台渲染只是把停顿拆成每次一个小任务，所以整页像素数和图块大小都设了上限（见 TILE_THRESHOLD_PIXELS），
+每次停顿的长度与渲染一个图块相当，而不是一整批页面。
+
+缩放时先把已有的（其他缩放比例的）页面图像拉伸显示，清晰的渲染结果在后台完成后再替换。
+
+放大到整页图像过大时改为分块渲染：每页只保留一张低分辨率的整页预览，
+视口内的区域按固定大小的图块用 get_pixmap(clip=...) 渲染，内存只与视口大小有关。
+
+连续的 Ctrl+滚轮事件由 ZoomController 合并：缩放比例吸附到固定档位并立即以拉伸预览显示，
+滚轮停下后才开始渲染清晰页面。
+按宽度自适应时改变窗口或分割条大小同样如此：拖动过程中立即按新宽度重新布局并拉伸现有图像，
+停下后只重新渲染视口附近的页面。
+
+渲染结果以 PixmapImage 的形式直接引用 MuPDF 的像素缓冲区，从渲染到绘制不再复制像素数据。
+"""
+import bisect
+import heapq
+import itertools
+import math
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+from PyQt5.QtWidgets import QScrollArea, QWidget
+from PyQt5.QtCore import Qt, QTimer, QRect, QObject, pyqtSignal
+from PyQt5.QtGui import QPainter, QImage, QColor, QPen
+
+PAGE_SPACING = 10  # 页面之间的间距（像素）
+PAGE_MARGIN = 10  # 页面与视图边缘的留白（像素）
+PRELOAD_SCREENS = 1  # 视口上下各预先渲染多少屏
+KEEP_SCREENS = 3  # 离开视口超过多少屏的页面释放图像
+MIN_ZOOM = 0.1
+MAX_ZOOM = 8.0
+# 后台渲染线程数。PyMuPDF 渲染时不释放GIL，多开线程只会互相争抢GIL（缩略图、文档加载和预取也各有一个线程）
+RENDER_WORKERS = 1
+TILE_SIZE = 256  # 分块渲染时每个图块的边长（像素）
+# 整页超过该像素数时改为分块渲染；也是分块页面低分辨率预览的大小，即一次整页渲染的上限
+TILE_THRESHOLD_PIXELS = 1024 * 1024
+# 滚轮缩放的固定档位（档位固定，渲染缓存才能命中）
+ZOOM_STEPS = (0.25, 0.33, 0.5, 0.67, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0, 4.0, 5.0, 6.0, 8.0)
+ZOOM_SETTLE_MS = 150  # 滚轮停止多久后开始渲染（毫秒）
+RESIZE_SETTLE_MS = 200  # 窗口停止改变大小多久后重新渲染（毫秒）
+WHEEL_STEP_ANGLE = 120  # 普通鼠标滚轮一格的角度增量，触控板的细小增量累计到一格再缩放
+
+BACKGROUND_COLOR = QColor(128, 128, 128)
+PLACEHOLDER_COLOR = QColor(255, 255, 255)
+PLACEHOLDER_BORDER = QColor(200, 200, 200)
+
+
+class PixmapImage(QImage):
+    """直接使用 fitz.Pixmap 像素内存的 QImage
+
+    通过 samples_mv 引用 MuPDF 的像素缓冲区，不复制数据；图像对象持有该 Pixmap，
+    保证缓冲区在图像存活期间有效。渲染一页只有 MuPDF 光栅化时写入的那一份像素数据。
+    注意不要用 QImage(img) 之类的方式把它转成普通 QImage 长期保存，那样不会持有 Pixmap。
+    """
+
+    def __init__(self, pix):
+        super().__init__(pix.samples_mv, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
+        self.pixmap = pix
+
+
+def render_page_image(doc, page_idx, zoom, tile=None):
+    """把一页（或其中一个图块）渲染为 QImage，tile 为图块坐标 (列, 行)"""
+    page = doc.load_page(page_idx)
+    clip = None
+    if tile is not None:
+        # 图块在页面坐标系（点）中的范围，超出页面的部分由 MuPDF 自动裁掉
+        size = TILE_SIZE / zoom
+        left = page.rect.x0 + tile[0] * size
+        top = page.rect.y0 + tile[1] * size
+        clip = fitz.Rect(left, top, left + size, top + size) & page.rect
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    return PixmapImage(pix)
+
+
+def quantize_zoom(zoom):
+    """缩放比例取两位小数（向下取整），相同档位的渲染结果可以复用缓存"""
+    return max(MIN_ZOOM, min(MAX_ZOOM, math.floor(zoom * 100) / 100))
+
+
+class PageCache:
+    """按内存上限做LRU淘汰的页面图像缓存，键为 (文档标识, 页码, 缩放比例, 图块或None)"""
+
+    def __init__(self, budget_mb):
+        self.budget = budget_mb * 1024 * 1024
+        self.used = 0
+        self._items = OrderedDict()
+        self._zooms = {}  # (文档标识, 页码) -> 已缓存的缩放比例集合
+
+    def get(self, key):
+        image = self._items.get(key)
+        if image is not None:
+            self._items.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        size = image.sizeInBytes()
+        if size > self.budget:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.used -= old.sizeInBytes()
+        self._items[key] = image
+        if key[3] is None:
+            self._zooms.setdefault(key[:2], set()).add(key[2])
+        self.used += size
+        while self.used > self.budget:
+            evicted_key, evicted = self._items.popitem(last=False)
+            self.used -= evicted.sizeInBytes()
+            if evicted_key[3] is None:
+                zooms = self._zooms[evicted_key[:2]]
+                zooms.discard(evicted_key[2])
+                if not zooms:
+                    del self._zooms[evicted_key[:2]]
+
+    def closest(self, doc_id, page_idx, zoom):
+        """返回该页缩放比例最接近 zoom 的整页缓存图像 (缩放比例, QImage)，用于缩放时的临时预览"""
+        zooms = self._zooms.get((doc_id, page_idx))
+        if not zooms:
+            return None
+        # 优先选比目标更清晰的，其次选最接近的
+        best = min(zooms, key=lambda z: (z < zoom, abs(math.log(z / zoom))))
+        return best, self.get((doc_id, page_idx, best, None))
+
+    def clear(self):
+        self._items.clear()
+        self._zooms.clear()
+        self.used = 0
+
+
+def fit_width_zoom(page_sizes, viewport_width):
+    """让最宽的页面正好占满视口宽度的缩放比例，page_sizes 为 [(宽, 高), ...]（点）"""
+    if not page_sizes:
+        return 1.0
+    max_width = max(width for width, _ in page_sizes)
+    return quantize_zoom((viewport_width - 2 * PAGE_MARGIN) / max_width)
+
+
+def open_render_document(source):
+    """在渲染线程中打开文档：source 为文件路径或内存缓冲区"""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=memoryview(source), filetype="pdf")
+
+
+class RenderService(QObject):
+    """后台页面渲染服务
+
+    request() 提交的任务按优先级（数值越小越先渲染）执行，每次提交会替换尚未开始的任务，
+    因此滚动或缩放后旧的请求会被自动取消。set_source() 切换文档时递增代号，
+    界面据此丢弃过期结果。
+    """
+    page_rendered = pyqtSignal(int, int, float, object, object)  # (代号, 页码, 缩放比例, 图块, QImage)
+
+    def __init__(self, workers=RENDER_WORKERS, parent=None):
+        super().__init__(parent)
+        self._cond = threading.Condition()
+        self._queue = []  # (优先级, 序号, 页码, 缩放比例, 图块)
+        self._counter = itertools.count()
+        self._running = set()  # 正在渲染的 (代号, 页码, 缩放比例, 图块)
+        self._generation = 0
+        self._source = None
+        self._stopped = False
+        self._threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def set_source(self, source):
+        """切换要渲染的文档（None 表示关闭），返回新的代号"""
+        with self._cond:
+            self._generation += 1
+            self._source = source
+            self._queue.clear()
+            self._cond.notify_all()
+            return self._generation
+
+    def request(self, jobs):
+        """提交 [(优先级, 页码, 缩放比例, 图块或None), ...]，替换所有尚未开始的任务"""
+        with self._cond:
+            self._queue = [(priority, next(self._counter), page_idx, zoom, tile)
+                           for priority, page_idx, zoom, tile in jobs
+                           if (self._generation, page_idx, zoom, tile) not in self._running]
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def cancel(self):
+        """取消所有尚未开始的任务"""
+        self.request([])
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def _worker(self):
+        doc = None
+        doc_generation = None
+        while True:
+            with self._cond:
+                while not self._stopped and not self._queue and doc_generation == self._generation:
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                generation = self._generation
+                source = self._source
+                job = heapq.heappop(self._queue) if self._queue else None
+                if job is not None:
+                    self._running.add((generation,) + job[2:])
+
+            try:
+                # 文档已切换：关闭本线程的旧文档句柄，有任务时再打开新文档
+                if doc_generation != generation:
+                    if doc is not None:
+                        doc.close()
+                    doc = None
+                    doc_generation = generation
+                if job is None or source is None:
+                    continue
+                if doc is None:
+                    doc = open_render_document(source)
+                _, _, page_idx, zoom, tile = job
+                image = render_page_image(doc, page_idx, zoom, tile)
+                self.page_rendered.emit(generation, page_idx, zoom, tile, image)
+            except Exception as e:
+                print(f"页面渲染失败: {str(e)}")
+            finally:
+                if job is not None:
+                    with self._cond:
+                        self._running.discard((generation,) + job[2:])
+
+        if doc is not None:
+            doc.close()
+
+
+class ZoomController(QObject):
+    """合并一连串滚轮缩放事件：每格跳到相邻的缩放档位并立即预览，停止后只渲染一次"""
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.target = None  # 本次手势的目标缩放比例
+        self.pending_angle = 0
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.timeout.connect(self.settle)
+
+    def wheel(self, angle):
+        """处理一次 Ctrl+滚轮事件，angle 为 angleDelta().y()"""
+        self.pending_angle += angle
+        steps = int(self.pending_angle / WHEEL_STEP_ANGLE)
+        if steps:
+            self.pending_angle -= steps * WHEEL_STEP_ANGLE
+            zoom = self.target if self.target is not None else self.view.zoom
+            for _ in range(abs(steps)):
+                zoom = self.next_step(zoom, steps > 0)
+            self.target = zoom
+            self.view.set_zoom(zoom, render=False)
+        self.settle_timer.start(ZOOM_SETTLE_MS)
+
+    @staticmethod
+    def next_step(zoom, zoom_in):
+        """zoom 之后（或之前）的相邻档位"""
+        if zoom_in:
+            return next((step for step in ZOOM_STEPS if step > zoom * 1.001), ZOOM_STEPS[-1])
+        return next((step for step in reversed(ZOOM_STEPS) if step < zoom * 0.999), ZOOM_STEPS[0])
+
+    def cancel(self):
+        self.settle_timer.stop()
+        self.pending_angle = 0
+        self.target = None
+
+    def settle(self):
+        """滚轮已停止：按最终缩放比例开始渲染"""
+        self.pending_angle = 0
+        if self.target is not None:
+            self.view.set_zoom(self.target)
+            self.target = None
+
+
+class PageCanvas(QWidget):
+    """承载所有页面的画布，只绘制需要重绘的区域"""
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        self.view.paint_pages(painter, event.rect())
+
+
+class PageView(QScrollArea):
+    zoom_changed = pyqtSignal(float)  # 缩放比例确定（开始渲染）后发出
+
+    def __init__(self, cache_mb, parent=None, render_workers=RENDER_WORKERS):
+        """cache_mb 为已渲染页面缓存的内存上限（MB）"""
+        super().__init__(parent)
+        self.doc = None
+        self.doc_id = None  # 文档标识，用作页面缓存键的一部分
+        self.generation = 0
+        self.cache = PageCache(cache_mb)
+        self.page_sizes = []  # 每页在缩放为1时的 (宽, 高)，单位为点
+        self.page_tops = []  # 每页顶部在画布中的纵坐标
+        self.zoom = 1.0
+        self.fit_width = True  # 是否按视口宽度自适应缩放
+        self.render_paused = False  # 缩放手势进行中时暂停渲染，只显示拉伸预览
+        self.images = {}  # 页码 -> (渲染时的缩放比例, QImage)
+        self.tiles = {}  # (页码, 图块) -> (渲染时的缩放比例, QImage)，仅用于分块渲染的页面
+
+        self.canvas = PageCanvas(self)
+        self.setWidget(self.canvas)
+        self.setWidgetResizable(False)
+        self.setAlignment(Qt.AlignHCenter | Qt.AlignTop)
+        # 竖直滚动条常显，避免自适应宽度时滚动条出现/消失导致反复重排
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        palette = self.viewport().palette()
+        palette.setColor(self.viewport().backgroundRole(), BACKGROUND_COLOR)
+        self.viewport().setPalette(palette)
+
+        # 滚动、缩放时合并为一次刷新
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.update_visible_pages)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_update)
+        self.horizontalScrollBar().valueChanged.connect(self.schedule_update)
+        # 连续改变大小时，停下后才重新渲染
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.finish_resize)
+
+        self.render_service = RenderService(render_workers, self)
+        self.render_service.page_rendered.connect(self.on_page_rendered)
+        self.zoom_controller = ZoomController(self)
+
+    # ---------------- 文档与缩放 ----------------
+    def set_document(self, doc, source=None, doc_id=None, previews=None, page_sizes=None):
+        """显示新文档（按视口宽度自适应）
+
+        source 是渲染线程用来各自打开文档的文件路径或内存缓冲区，为空时使用 doc.name；
+        doc_id 用于页面缓存，同一份文件内容应得到相同的标识，为空时不复用其他打开过的缓存；
+        previews 为 {页码: QImage} 的预先生成的页面图像，在清晰版本渲染完成前拉伸显示；
+        page_sizes 为已知的各页尺寸 [(宽, 高), ...]，为空时逐页读取。
+        """
+        self.doc = doc
+        self.images.clear()
+        self.tiles.clear()
+        if doc is not None and source is None:
+            source = doc.name
+        self.doc_id = doc_id if doc_id is not None else ("doc", id(doc))
+        self.generation = self.render_service.set_source(source if doc is not None else None)
+        if page_sizes is not None:
+            self.page_sizes = list(page_sizes)
+        else:
+            self.page_sizes = []
+            if doc is not None:
+                for page_idx in range(doc.page_count):
+                    rect = doc.load_page(page_idx).rect
+                    self.page_sizes.append((rect.width, rect.height))
+        for page_idx, image in (previews or {}).items():
+            if page_idx < len(self.page_sizes):
+                self.images[page_idx] = (image.width() / max(self.page_sizes[page_idx][0], 1), image)
+        self.zoom_controller.cancel()
+        self.resize_timer.stop()
+        self.render_paused = False
+        self.fit_width = True
+        self.zoom = self.fit_zoom()
+        self.relayout(keep_position=False)
+
+    def clear(self):
+        self.set_document(None)
+
+    def show_preview(self, page_sizes, previews):
+        """文档打开之前，先按预览文件中的页面尺寸布局，并显示预先生成的页面图像 {页码: QImage}"""
+        self.set_document(None, previews=previews, page_sizes=page_sizes)
+
+    def set_zoom(self, zoom, render=True):
+        """按指定比例缩放（不再自适应宽度）
+
+        render 为 False 时只重新布局并拉伸显示现有图像，不发起渲染（用于缩放手势进行中）。
+        """
+        self.fit_width = False
+        self.resize_timer.stop()
+        zoom = quantize_zoom(zoom)
+        was_paused = self.render_paused
+        self.render_paused = not render
+        if not render:
+            self.render_service.cancel()
+        if zoom != self.zoom:
+            self.zoom = zoom
+            self.relayout()
+        elif was_paused and render:
+            self.schedule_update()
+        if render:
+            self.zoom_changed.emit(self.zoom)
+
+    def fit_zoom(self):
+        return fit_width_zoom(self.page_sizes, self.viewport().width())
+
+    def fit_to_width(self):
+        """恢复按视口宽度自适应缩放"""
+        self.zoom_controller.cancel()
+        self.fit_width = True
+        if self.doc is not None and self.fit_zoom() != self.zoom:
+            self.zoom = self.fit_zoom()
+            self.relayout()
+        self.finish_resize()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.fit_width and self.doc is not None:
+            zoom = self.fit_zoom()
+            if zoom != self.zoom:
+                # 立即按新宽度重新布局，现有图像先拉伸显示，停止改变大小后再渲染
+                self.zoom = zoom
+                self.render_paused = True
+                self.render_service.cancel()
+                self.relayout()
+                self.resize_timer.start(RESIZE_SETTLE_MS)
+                return
+        self.schedule_update()
+
+    def finish_resize(self):
+        """大小已稳定：按当前缩放比例渲染视口附近的页面"""
+        self.resize_timer.stop()
+        self.render_paused = False
+        self.schedule_update()
+        self.zoom_changed.emit(self.zoom)
+
+    def wheelEvent(self, event):
+        # Ctrl+滚轮交给父窗口处理缩放
+        if event.modifiers() & Qt.ControlModifier:
+            event.ignore()
+            return
+        super().wheelEvent(event)
+
+    # ---------------- 布局 ----------------
+    def page_height(self, page_idx):
+        return int(self.page_sizes[page_idx][1] * self.zoom)
+
+    def page_rect(self, page_idx):
+        width, height = self.page_sizes[page_idx]
+        width, height = int(width * self.zoom), int(height * self.zoom)
+        left = (self.canvas.width() - width) // 2
+        return QRect(left, self.page_tops[page_idx], width, height)
+
+    def relayout(self, keep_position=True):
+        """按当前缩放重新计算各页位置，并尽量保持视口顶部所在的页面位置不变"""
+        anchor = None
+        if keep_position and self.page_tops:
+            scroll_y = self.verticalScrollBar().value()
+            page_idx = self.page_at(scroll_y)
+            old_height = max(1, self.laid_out_height(page_idx))
+            anchor = (page_idx, (scroll_y - self.page_tops[page_idx]) / old_height)
+
+        self.page_tops = []
+        y = PAGE_MARGIN
+        max_width = 0
+        for width, height in self.page_sizes:
+            self.page_tops.append(y)
+            y += int(height * self.zoom) + PAGE_SPACING
+            max_width = max(max_width, int(width * self.zoom))
+        total_height = y - PAGE_SPACING + PAGE_MARGIN if self.page_sizes else 0
+        self.canvas.resize(max(self.viewport().width(), max_width + 2 * PAGE_MARGIN), total_height)
+
+        if anchor is not None:
+            page_idx, fraction = anchor
+            self.verticalScrollBar().setValue(
+                self.page_tops[page_idx] + int(fraction * self.page_height(page_idx)))
+        elif not keep_position:
+            self.verticalScrollBar().setValue(0)
+
+        self.canvas.update()
+        self.schedule_update()
+
+    def laid_out_height(self, page_idx):
+        """relayout 之前（旧缩放比例下）某页占用的高度"""
+        if page_idx + 1 < len(self.page_tops):
+            return self.page_tops[page_idx + 1] - self.page_tops[page_idx] - PAGE_SPACING
+        return self.canvas.height() - self.page_tops[page_idx] - PAGE_MARGIN
+
+    def page_at(self, y):
+        """返回纵坐标 y 处（或其上方最近）的页码"""
+        return max(0, bisect.bisect_right(self.page_tops, y) - 1)
+
+    def pages_between(self, top, bottom):
+        """与纵向区间 [top, bottom] 相交的页码范围"""
+        if not self.page_tops:
+            return range(0)
+        return range(self.page_at(top), min(len(self.page_tops), self.page_at(bottom) + 1))
+
+    def current_page(self):
+        """视口中部所在的页码"""
+        return self.page_at(self.verticalScrollBar().value() + self.viewport().height() // 2)
+
+    def scroll_to_page(self, page_idx):
+        if 0 <= page_idx < len(self.page_tops):
+            self.verticalScrollBar().setValue(self.page_tops[page_idx] - PAGE_MARGIN)
+
+    def visible_pages(self, screens=0):
+        """视口内的页面，screens 表示上下额外扩展的屏数"""
+        top = self.verticalScrollBar().value()
+        height = self.viewport().height()
+        return self.pages_between(top - screens * height, top + height + screens * height)
+
+    def visible_rect(self, screens=0.0):
+        """视口在画布中的区域，screens 表示四周额外扩展的屏数"""
+        width, height = self.viewport().width(), self.viewport().height()
+        dx, dy = int(width * screens), int(height * screens)
+        return QRect(self.horizontalScrollBar().value() - dx, self.verticalScrollBar().value() - dy,
+                     width + 2 * dx, height + 2 * dy)
+
+    # ---------------- 分块 ----------------
+    def is_tiled(self, page_idx):
+        """当前缩放下整页像素数过大的页面改为分块渲染"""
+        width, height = self.page_sizes[page_idx]
+        return width * height * self.zoom * self.zoom > TILE_THRESHOLD_PIXELS
+
+    def page_image_zoom(self, page_idx):
+        """该页整页图像应使用的缩放比例：分块页面只保留一张像素数受限的低分辨率预览"""
+        if not self.is_tiled(page_idx):
+            return self.zoom
+        width, height = self.page_sizes[page_idx]
+        return quantize_zoom(math.sqrt(TILE_THRESHOLD_PIXELS / (width * height)))
+
+    def tile_rect(self, page_idx, tile):
+        page = self.page_rect(page_idx)
+        left = page.left() + tile[0] * TILE_SIZE
+        top = page.top() + tile[1] * TILE_SIZE
+        return QRect(left, top, min(TILE_SIZE, page.right() + 1 - left), min(TILE_SIZE, page.bottom() + 1 - top))
+
+    def tiles_in(self, page_idx, region):
+        """与 region 相交的图块坐标"""
+        page = self.page_rect(page_idx)
+        area = page.intersected(region)
+        if area.isEmpty():
+            return []
+        cols = range((area.left() - page.left()) // TILE_SIZE, (area.right() - page.left()) // TILE_SIZE + 1)
+        rows = range((area.top() - page.top()) // TILE_SIZE, (area.bottom() - page.top()) // TILE_SIZE + 1)
+        return [(col, row) for row in rows for col in cols]
+
+    # ---------------- 渲染 ----------------
+    def schedule_update(self):
+        if not self.update_timer.isActive():
+            self.update_timer.start(0)
+
+    def update_visible_pages(self):
+        """请求渲染视口附近缺少图像的页面和图块（离视口越近越优先），释放远离视口的图像"""
+        if self.doc is None or self.render_paused:
+            return
+
+        keep = self.visible_pages(KEEP_SCREENS)
+        for page_idx in list(self.images):
+            if page_idx not in keep:
+                del self.images[page_idx]
+        # 图块只保留当前缩放比例、视口周围一屏之内的部分
+        keep_rect = self.visible_rect(1)
+        for key, (zoom, _) in list(self.tiles.items()):
+            if zoom != self.zoom or not self.tile_rect(*key).intersects(keep_rect):
+                del self.tiles[key]
+
+        view = self.visible_rect()
+        preload_rect = self.visible_rect(0.5)
+        jobs = []
+        for page_idx in self.visible_pages(PRELOAD_SCREENS):
+            self.request_page_image(page_idx, view, jobs)
+            if self.is_tiled(page_idx):
+                for tile in self.tiles_in(page_idx, preload_rect):
+                    self.request_tile(page_idx, tile, view, jobs)
+        self.render_service.request(jobs)
+
+    def distance_to(self, rect, view):
+        """rect 与视口之间的距离（像素），用作渲染优先级"""
+        dx = max(0, rect.left() - view.right(), view.left() - rect.right())
+        dy = max(0, rect.top() - view.bottom(), view.top() - rect.bottom())
+        return dx + dy
+
+    def request_page_image(self, page_idx, view, jobs):
+        """该页缺少所需缩放比例的整页图像时，先用缓存，否则加入渲染任务"""
+        zoom = self.page_image_zoom(page_idx)
+        cached = self.images.get(page_idx)
+        if cached is not None and cached[0] == zoom:
+            return
+        image = self.cache.get((self.doc_id, page_idx, zoom, None))
+        if image is not None:
+            self.images[page_idx] = (zoom, image)
+            self.canvas.update(self.page_rect(page_idx))
+            return
+        # 没有任何图像的页面先用其他缩放比例的缓存拉伸预览，清晰版本渲染完成后替换
+        if cached is None:
+            preview = self.cache.closest(self.doc_id, page_idx, zoom)
+            if preview is not None:
+                self.images[page_idx] = preview
+                self.canvas.update(self.page_rect(page_idx))
+        jobs.append((self.distance_to(self.page_rect(page_idx), view), page_idx, zoom, None))
+
+    def request_tile(self, page_idx, tile, view, jobs):
+        if (page_idx, tile) in self.tiles:
+            return
+        image = self.cache.get((self.doc_id, page_idx, self.zoom, tile))
+        if image is not None:
+            self.tiles[(page_idx, tile)] = (self.zoom, image)
+            self.canvas.update(self.tile_rect(page_idx, tile))
+            return
+        jobs.append((self.distance_to(self.tile_rect(page_idx, tile), view), page_idx, self.zoom, tile))
+
+    def on_page_rendered(self, generation, page_idx, zoom, tile, image):
+        """后台渲染完成：只接收当前文档、仍在保留范围内的页面或图块"""
+        if generation != self.generation:
+            return
+        self.cache.put((self.doc_id, page_idx, zoom, tile), image)
+
+        if tile is not None:
+            if zoom == self.zoom and self.tile_rect(page_idx, tile).intersects(self.visible_rect(1)):
+                self.tiles[(page_idx, tile)] = (zoom, image)
+                self.canvas.update(self.tile_rect(page_idx, tile))
+            return
+
+        if page_idx not in self.visible_pages(KEEP_SCREENS):
+            return
+        # 其他缩放比例的结果只在该页还没有任何图像时作为预览
+        if zoom != self.page_image_zoom(page_idx) and page_idx in self.images:
+            return
+        self.images[page_idx] = (zoom, image)
+        self.canvas.update(self.page_rect(page_idx))
+
+    def paint_pages(self, painter, rect):
+        """绘制与 rect 相交的页面：已渲染的画图像，未渲染的画占位框
+
+        图像的缩放比例与当前一致时原样绘制；不一致时（缩放后清晰版本尚未渲染完成）
+        直接拉伸旧图像作为预览，不做平滑处理，保证在一帧内完成。
+        """
+        for page_idx in self.pages_between(rect.top(), rect.bottom()):
+            target = self.page_rect(page_idx)
+            cached = self.images.get(page_idx)
+            if cached is not None and cached[0] == self.zoom:
+                painter.drawImage(target.topLeft(), cached[1])
+            elif cached is not None:
+                painter.drawImage(target, cached[1])
+            else:
+                painter.fillRect(target, PLACEHOLDER_COLOR)
+                painter.setPen(QPen(PLACEHOLDER_BORDER))
+                painter.drawRect(target.adjusted(0, 0, -1, -1))
+                painter.drawText(target, Qt.AlignCenter, f"第 {page_idx + 1} 页")
+
+            # 分块页面在预览图上叠加已渲染好的清晰图块
+            if self.tiles and self.is_tiled(page_idx):
+                for tile in self.tiles_in(page_idx, rect):
+                    tile_image = self.tiles.get((page_idx, tile))
+                    if tile_image is not None:
+                        painter.drawImage(self.tile_rect(page_idx, tile).topLeft(), tile_image[1])
+
+    def shutdown(self):
+        self.render_service.shutdown()
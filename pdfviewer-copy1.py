@@ -1,11 +1,13 @@
-import sys, os, hashlib, datetime, uuid, json, base64, tempfile, socket, struct, requests, time
+import sys, os, hashlib, datetime, uuid, json, base64, tempfile, requests, time
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QPushButton,
                              QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem,
                              QMessageBox, QLineEdit, QSplitter, QDialog, QScrollArea, QSizePolicy)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage
 import fitz  # PyMuPDF
 
+from trusted_time import TrustedTimeService, NTP_SERVERS_FILE, load_server_list
+
 # ---------------- 配置参数 ----------------
 SECRET_KEY = "MySecretKey123"
 CODE_LENGTH = 24
@@ -14,7 +16,7 @@ AUTH_FILE = "auth_info.json"
 TIME_BASE_FILE = "time_base.json"
 LOGO_FILE_NAME = "logo.png"
 
-# NTP服务器（按延迟排序）
+# NTP服务器（按延迟排序），有 test_ntp.py 生成的 ntp_servers.json 时以其为准
 NTP_SERVERS = [
     "cn.pool.ntp.org",  # 延迟: 44.5ms
     "ntp.tencent.com",  # 延迟: 60.26ms
@@ -22,20 +24,18 @@ NTP_SERVERS = [
     "ntp.aliyun.com",  # 延迟: 74.03ms
     "time2.aliyun.com"  # 延迟: 77.92ms
 ]
-NTP_PORT = 123
-NTP_PACKET_FORMAT = "!12I"
-NTP_DELTA = 2208988800  # 1970-01-01到1900-01-01的秒数
 BEIJING_TIME_DELTA = datetime.timedelta(hours=8)  # UTC+8
 
-# HTTP时间接口（备用）
+# HTTP时间接口（备用，解析为UTC时间戳）
 HTTP_TIME_APIS = [
     {
         "url": "http://api.m.taobao.com/rest/api3.do?api=mtop.common.getTimestamp",
-        "parser": lambda resp: datetime.datetime.fromtimestamp(int(resp.json()["data"]["t"]) / 1000)
+        "parser": lambda resp: int(resp.json()["data"]["t"]) / 1000
     },
     {
         "url": "https://time.tencent.com/",
-        "parser": lambda resp: datetime.datetime.strptime(resp.text.strip(), "%Y-%m-%d %H:%M:%S")
+        "parser": lambda resp: (datetime.datetime.strptime(resp.text.strip(), "%Y-%m-%d %H:%M:%S")
+                                - BEIJING_TIME_DELTA).replace(tzinfo=datetime.timezone.utc).timestamp()
     }
 ]
 
@@ -84,9 +84,9 @@ def init_time_base():
         # 2. 获取系统单调时钟（从启动到现在的累计时间，不受日期影响）
         monotonic_initial = time.monotonic()
 
-        # 3. 获取首次网络时间（作为辅助基准）
-        trusted_time, _ = get_trusted_time()
-        network_time_ts = trusted_time.timestamp() if trusted_time else None
+        # 3. 获取首次网络时间（作为辅助基准）；未取得网络时间时不记录，之后补记
+        trusted_time, source = get_trusted_time()
+        network_time_ts = trusted_time.timestamp() if is_network_time(source) else None
 
         # 加密存储时间基准
         data = {
@@ -104,6 +104,43 @@ def init_time_base():
         sys.exit(1)
 
 
+def check_time_base():
+    """校验已有的时间基准，发现异常时抛出 ValueError（不弹窗、不退出）"""
+    time_base_path = os.path.join(os.path.expanduser("~"), TIME_BASE_FILE)
+    with open(time_base_path, "r") as f:
+        data = json.load(f)
+
+    # 1. 校验时间基准文件未被篡改
+    expected_checksum = hashlib.sha256(
+        f"{data['file_mtime']}|{data['monotonic_initial']}|{SECRET_KEY}".encode()).hexdigest()
+    if data["checksum"] != expected_checksum:
+        raise ValueError("时间基准文件已被篡改")
+
+    # 2. 验证程序文件修改时间未变（防止替换旧版本程序）
+    main_file_path = get_main_executable_path()
+    current_file_mtime = os.path.getmtime(main_file_path)
+    if abs(current_file_mtime - data["file_mtime"]) > 30:  # 允许30秒误差（文件复制耗时）
+        raise ValueError("程序文件已被修改或替换，授权失效")
+
+    # 3. 验证单调时钟是否合理（累计时间不能减少）
+    current_monotonic = time.monotonic()
+    if current_monotonic < data["monotonic_initial"] - 5:  # 允许5秒误差（系统休眠唤醒）
+        raise ValueError("系统时间异常（可能通过重启或修改时钟绕过）")
+
+    # 4. 若存在网络时间基准，验证当前时间与历史网络时间的逻辑合理性
+    trusted_time, source = get_trusted_time()
+    if data["network_time_ts"]:
+        current_network_ts = trusted_time.timestamp()
+        # 允许网络时间±2天误差（考虑离线情况），但不能早于历史网络时间太多
+        if current_network_ts < data["network_time_ts"] - 86400 * 2:
+            raise ValueError("当前时间早于历史记录，可能被篡改")
+    elif is_network_time(source):
+        # 首次运行时没有取得网络时间，现在补记基准
+        data["network_time_ts"] = trusted_time.timestamp()
+        with open(time_base_path, "w") as f:
+            json.dump(data, f)
+
+
 def verify_time_base():
     """验证时间基准是否有效，防止通过修改系统时间绕过"""
     time_base_path = os.path.join(os.path.expanduser("~"), TIME_BASE_FILE)
@@ -112,34 +149,7 @@ def verify_time_base():
         return True
 
     try:
-        with open(time_base_path, "r") as f:
-            data = json.load(f)
-
-        # 1. 校验时间基准文件未被篡改
-        expected_checksum = hashlib.sha256(
-            f"{data['file_mtime']}|{data['monotonic_initial']}|{SECRET_KEY}".encode()).hexdigest()
-        if data["checksum"] != expected_checksum:
-            raise ValueError("时间基准文件已被篡改")
-
-        # 2. 验证程序文件修改时间未变（防止替换旧版本程序）
-        main_file_path = get_main_executable_path()
-        current_file_mtime = os.path.getmtime(main_file_path)
-        if abs(current_file_mtime - data["file_mtime"]) > 30:  # 允许30秒误差（文件复制耗时）
-            raise ValueError("程序文件已被修改或替换，授权失效")
-
-        # 3. 验证单调时钟是否合理（累计时间不能减少）
-        current_monotonic = time.monotonic()
-        if current_monotonic < data["monotonic_initial"] - 5:  # 允许5秒误差（系统休眠唤醒）
-            raise ValueError("系统时间异常（可能通过重启或修改时钟绕过）")
-
-        # 4. 若存在网络时间基准，验证当前时间与历史网络时间的逻辑合理性
-        if data["network_time_ts"]:
-            trusted_time, _ = get_trusted_time()
-            current_network_ts = trusted_time.timestamp()
-            # 允许网络时间±2天误差（考虑离线情况），但不能早于历史网络时间太多
-            if current_network_ts < data["network_time_ts"] - 86400 * 2:
-                raise ValueError("当前时间早于历史记录，可能被篡改")
-
+        check_time_base()
         return True
 
     except Exception as e:
@@ -148,66 +158,54 @@ def verify_time_base():
 
 
 # ---------------- 时间获取核心逻辑 ----------------
-class TimeFetcherThread(QThread):
-    time_fetched = pyqtSignal(datetime.datetime, str)  # (北京时间, 来源/错误信息)
+def fetch_http_time():
+    """NTP全部失败时的备用方案，在可信时间服务的后台线程中执行"""
+    for api in HTTP_TIME_APIS:
+        try:
+            response = requests.get(api["url"], timeout=3, verify=False)
+            return api["parser"](response), f"HTTP({api['url']})"
+        except:
+            continue
+    return None
 
-    def run(self):
-        # 1. 尝试NTP服务器
-        for server in NTP_SERVERS:
-            try:
-                client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                data = b'\x1b' + 47 * b'\0'
-                client.sendto(data, (server, NTP_PORT))
-                client.settimeout(3)
-                data, _ = client.recvfrom(1024)
-                client.close()
-
-                unpacked = struct.unpack(NTP_PACKET_FORMAT, data[0:48])
-                transmit_timestamp = unpacked[10] + float(unpacked[11]) / 2 ** 32
-                utc_time = datetime.datetime.utcfromtimestamp(transmit_timestamp - NTP_DELTA)
-                beijing_time = utc_time + BEIJING_TIME_DELTA
-                self.time_fetched.emit(beijing_time, f"NTP({server})")
-                return
-            except:
-                continue
 
-        # 2. 尝试HTTP接口
-        for api in HTTP_TIME_APIS:
-            try:
-                response = requests.get(api["url"], timeout=3, verify=False)
-                beijing_time = api["parser"](response)
-                self.time_fetched.emit(beijing_time, f"HTTP({api['url']})")
-                return
-            except:
-                continue
+# 程序启动时在后台同步，之后的取时只读单调时钟
+TIME_SERVICE = TrustedTimeService(load_server_list(get_resource_path(NTP_SERVERS_FILE), NTP_SERVERS),
+                                  fallback=fetch_http_time)
+time_warning_shown = False
+
+
+class TimeSyncNotifier(QObject):
+    """把后台线程中的同步成功通知转到 GUI 线程"""
+    synced = pyqtSignal()
 
-        # 3. 所有方式失败，返回本地时间
-        local_time = datetime.datetime.now()
-        self.time_fetched.emit(local_time, f"本地时间（网络时间获取失败）")
+
+def is_network_time(source):
+    return source.startswith(("NTP", "HTTP"))
 
 
 def get_trusted_time():
-    thread = TimeFetcherThread()
-    result = [None, ""]
-
-    def on_time_fetched(time, source):
-        result[0] = time
-        result[1] = source
-
-    thread.time_fetched.connect(on_time_fetched)
-    thread.start()
-    thread.wait(5000)
-
-    if result[0] is not None:
-        if "本地时间" in result[1]:
-            QMessageBox.warning(None, "时间警告",
-                                "无法获取网络时间，将使用本地时间。\n"
-                                "请注意：本地时间可能被篡改，导致授权校验不准确。")
-        return result[0], result[1]
-    else:
-        local_time = datetime.datetime.now()
-        QMessageBox.critical(None, "时间获取失败", "无法通过网络获取时间，强制使用本地时间！")
-        return local_time, "强制本地时间"
+    """返回 (北京时间, 来源)，不等待网络
+
+    网络时间尚未同步时先返回本地时间，同步成功后由 recheck_after_sync() 用网络时间重新校验时间基准和授权；
+    之后只读缓存的网络时间。网络时间获取失败时使用本地时间并提示，后台继续按间隔重试。
+    """
+    global time_warning_shown
+    timestamp, source = TIME_SERVICE.now()
+    if timestamp is not None:
+        utc_time = datetime.datetime.utcfromtimestamp(timestamp)
+        return utc_time + BEIJING_TIME_DELTA, source
+
+    local_time = datetime.datetime.now()
+    if not TIME_SERVICE.finished:
+        TIME_SERVICE.start()
+        return local_time, "本地时间（网络时间同步中）"
+    if not time_warning_shown:
+        time_warning_shown = True
+        QMessageBox.warning(None, "时间警告",
+                            "无法获取网络时间，将使用本地时间。\n"
+                            "请注意：本地时间可能被篡改，导致授权校验不准确。")
+    return local_time, "本地时间（网络时间获取失败）"
 
 
 # ---------------- 授权函数（强化校验） ----------------
@@ -293,6 +291,30 @@ def is_auth_valid():
     return False
 
 
+def recheck_after_sync(main_win):
+    """网络时间同步成功后在 GUI 线程中重新校验时间基准和授权，失败时锁定查看器"""
+    if not main_win.isVisible():
+        # 启动时的授权窗口尚未通过，或已经锁定；授权窗口验证时会直接用到同步好的网络时间
+        return
+    try:
+        check_time_base()
+    except Exception as e:
+        main_win.lock()
+        QMessageBox.critical(None, "时间验证失败", f"检测到时间异常或程序被篡改: {str(e)}", QMessageBox.Ok)
+        QApplication.exit(1)
+        return
+
+    if is_auth_valid():
+        return
+    # 启动时按本地时间通过、按网络时间已过期的授权（如把系统时间调回过去）
+    main_win.lock()
+    auth_dialog = AuthDialog(parent=main_win)
+    if auth_dialog.exec_() == QDialog.Accepted:
+        main_win.showMaximized()
+    else:
+        QApplication.exit(0)
+
+
 # ---------------- 解密函数 ----------------
 def decrypt_file(encrypted_path):
     try:
@@ -595,6 +617,12 @@ class PDFBrowser(QWidget):
         self.temp_pdf = None
         self.doc = None
 
+    def lock(self):
+        """授权失效时关闭当前文档并隐藏窗口"""
+        self.clean_temp_file()
+        self.show_all_pages()
+        self.hide()
+
     def closeEvent(self, event):
         self.clean_temp_file()
         event.accept()
@@ -608,6 +636,13 @@ def main():
         font.setFamily("SimHei")
         app.setFont(font)
 
+        # 网络时间在后台同步，不阻塞启动；同步前的检查使用本地时间，同步成功后用网络时间重新检查
+        # 通知在 GUI 线程的事件循环中处理，那时 main_win 已经创建
+        time_sync_notifier = TimeSyncNotifier()
+        time_sync_notifier.synced.connect(lambda: recheck_after_sync(main_win))
+        TIME_SERVICE.on_synced = time_sync_notifier.synced.emit
+        TIME_SERVICE.start()
+
         # 程序启动时立即初始化并验证时间基准（核心改进）
         init_time_base()
         verify_time_base()
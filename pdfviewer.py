@@ -1,10 +1,17 @@
-import sys, os, hashlib, datetime, uuid, json, base64, tempfile
+import sys, os, hashlib, datetime, uuid, json, time, atexit
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QPushButton,
                              QVBoxLayout, QHBoxLayout, QTreeWidget, QTreeWidgetItem,
-                             QMessageBox, QLineEdit, QSplitter, QDialog, QScrollArea, QSizePolicy)
-from PyQt5.QtCore import Qt
+                             QMessageBox, QLineEdit, QSplitter, QDialog, QProgressBar)
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QPixmap, QImage
-import fitz  # PyMuPDF
+
+import enc_container
+import thumb_cache
+import tree_index
+from doc_pool import DocumentPool, close_document
+from page_view import PageView
+from thumbnail_panel import ThumbnailPanel
+from doc_loader import DocumentLoader, PREFETCH_DELAY
 
 # ---------------- 配置参数 ----------------
 SECRET_KEY = "MySecretKey123"
@@ -12,7 +19,26 @@ CODE_LENGTH = 24
 AUTH_FILE = "auth_info.json"
 # 新增：记录最近运行时间的文件
 LAST_RUN_FILE = "last_run_time.json"
+# 最近运行时间的写盘间隔（毫秒），两次写盘之间只在内存中用单调时钟推算
+LAST_RUN_SAVE_INTERVAL_MS = 5 * 60 * 1000
+# 重新读取授权文件的间隔（毫秒），其余时间只用缓存的到期日期判断
+LICENSE_RELOAD_INTERVAL_MS = 5 * 60 * 1000
 LOGO_FILE_NAME = "logo.png"  # Logo文件名
+# 加密容器密钥（与加密工具 generate_gui.py 使用同一 SECRET_KEY 派生）
+CONTAINER_KEY = enc_container.derive_key(SECRET_KEY)
+# 解密后不超过该大小（MB）的文档直接放在普通内存中，更大的使用匿名内存映射；两者都不写临时文件
+MEMORY_OPEN_LIMIT_MB = 256
+# 已渲染页面缓存的内存上限（MB），切换缩放比例或重新打开最近的文档时直接使用
+PAGE_CACHE_MB = 256
+# 缩略图磁盘缓存（位于用户目录，加密存储）及其大小上限（MB）
+THUMB_CACHE_DIR = "pdf_thumb_cache"
+THUMB_CACHE_MB = 200
+# 保留最近打开的文档个数及其解密缓冲区的总大小上限（MB），切回这些文件时无需重新解密
+DOC_POOL_SIZE = 4
+DOC_POOL_MB = 512
+# 打开文件后在后台预取同一目录中其后的几个文件，以及预取可使用的内存（MB）
+PREFETCH_COUNT = 2
+PREFETCH_MB = 256
 
 
 # 获取资源路径（兼容所有环境）
@@ -55,11 +81,13 @@ def get_last_run_time():
     return None
 
 
-def update_last_run_time():
-    """更新最近运行时间（精确到分钟，避免频繁写入）"""
+def update_last_run_time(timestamp=None):
+    """更新最近运行时间（精确到分钟，避免频繁写入），timestamp 为空时使用当前时间"""
     try:
+        if timestamp is None:
+            timestamp = datetime.datetime.now().timestamp()
         # 精确到分钟（减少写入次数，同时保留防篡改精度）
-        current_ts = int(datetime.datetime.now().timestamp() // 60 * 60)
+        current_ts = int(timestamp // 60 * 60)
         user_dir = os.path.expanduser("~")
         last_run_path = os.path.join(user_dir, LAST_RUN_FILE)
         # 加密存储（防止直接修改文件）
@@ -73,25 +101,62 @@ def update_last_run_time():
         print(f"更新最近运行时间失败: {str(e)}")
 
 
-def check_time_tampering():
-    """检查系统时间是否被倒退（防篡改核心）"""
-    current_ts = int(datetime.datetime.now().timestamp())
-    last_ts = get_last_run_time()
+class ClockGuard:
+    """进程内的时间防篡改检查
 
-    if last_ts is None:
-        # 首次运行，直接记录当前时间
-        update_last_run_time()
-        return True
+    只在第一次检查时读取一次最近运行时间，之后在内存中维护"时间水位线"：
+    上次检查时的时间加上 time.monotonic() 测得的流逝时间。系统时间早于水位线
+    （允许1分钟误差）即判定为被倒退。水位线由 save() 写盘（定时和退出时），
+    而不是每次检查都读写文件。
+    """
 
-    # 允许1分钟误差（系统时间同步可能有微小偏差）
-    if current_ts < last_ts - 60:
-        # 系统时间比上次运行时间早，判定为被篡改
-        return False
-    else:
-        # 时间正常，更新最近运行时间
-        update_last_run_time()
+    TOLERANCE = 60  # 允许1分钟误差（系统时间同步可能有微小偏差）
+
+    def __init__(self):
+        self.watermark = None  # 时间水位线（时间戳）
+        self.watermark_mono = None  # 记录水位线时的单调时钟读数
+        self.dirty = False
+
+    def check(self):
+        now = time.time()
+        mono = time.monotonic()
+        if self.watermark is None:
+            last_ts = get_last_run_time()
+            if last_ts is None:
+                # 首次运行，直接记录当前时间
+                self.watermark = now
+                self.watermark_mono = mono
+                self.dirty = True
+                self.save()
+                return True
+            self.watermark = last_ts
+            self.watermark_mono = mono
+
+        floor = self.watermark + (mono - self.watermark_mono)
+        if now < floor - self.TOLERANCE:
+            # 系统时间比应有的时间早，判定为被篡改
+            return False
+        # 时间正常，抬高水位线（系统时间向前跳变，如休眠唤醒后，以系统时间为准）
+        self.watermark = max(floor, now)
+        self.watermark_mono = mono
+        self.dirty = True
         return True
 
+    def save(self):
+        """把水位线写入最近运行时间文件"""
+        if self.dirty and self.watermark is not None:
+            update_last_run_time(self.watermark)
+            self.dirty = False
+
+
+CLOCK_GUARD = ClockGuard()
+atexit.register(CLOCK_GUARD.save)
+
+
+def check_time_tampering():
+    """检查系统时间是否被倒退（防篡改核心），只在内存中比较，不读写文件"""
+    return CLOCK_GUARD.check()
+
 
 # ---------------- 授权函数（集成时间防篡改） ----------------
 def get_machine_code():
@@ -109,9 +174,13 @@ def generate_auth_code(machine_code, valid_days=1):
 
     expire_date = datetime.datetime.now() + datetime.timedelta(days=valid_days)
     expire_str = expire_date.strftime("%Y%m%d")
+    return expected_auth_code(machine_code, expire_str), expire_str
+
+
+def expected_auth_code(machine_code, expire_str):
     data = f"{machine_code}|{expire_str}"
     digest = hashlib.sha256((data + SECRET_KEY).encode()).hexdigest()
-    return digest[:CODE_LENGTH].upper(), expire_str
+    return digest[:CODE_LENGTH].upper()
 
 
 def verify_auth_code(machine_code, auth_code_input, expire_str):
@@ -122,9 +191,7 @@ def verify_auth_code(machine_code, auth_code_input, expire_str):
     today_str = datetime.datetime.now().strftime("%Y%m%d")
     if today_str > str(expire_str):
         return False, "授权码已过期"
-    data = f"{machine_code}|{expire_str}"
-    digest = hashlib.sha256((data + SECRET_KEY).encode()).hexdigest()
-    expected = digest[:CODE_LENGTH].upper()
+    expected = expected_auth_code(machine_code, expire_str)
     return (expected == auth_code_input.upper(),
             "授权码有效" if expected == auth_code_input.upper() else "授权码不匹配")
 
@@ -140,43 +207,89 @@ def save_auth_info(machine_code, auth_code, expire_str):
         QMessageBox.warning(None, "保存失败", f"授权信息保存失败: {str(e)}")
 
 
-def load_auth_info():
+def get_auth_path():
+    return os.path.join(os.path.expanduser("~"), AUTH_FILE)
+
+
+def load_auth_info(quiet=False):
+    """读取授权文件；quiet 为 True 时（定时器等后台调用）出错只打印日志，不弹窗"""
     try:
-        user_dir = os.path.expanduser("~")
-        auth_path = os.path.join(user_dir, AUTH_FILE)
+        auth_path = get_auth_path()
         if os.path.exists(auth_path):
             with open(auth_path, "r") as f:
                 return json.load(f)
         return None
     except Exception as e:
-        QMessageBox.warning(None, "加载失败", f"授权信息加载失败: {str(e)}")
+        if quiet:
+            print(f"授权信息加载失败: {str(e)}")
+        else:
+            QMessageBox.warning(None, "加载失败", f"授权信息加载失败: {str(e)}")
         return None
 
 
+class LicenseSession:
+    """缓存授权信息
+
+    授权文件只在第一次检查、验证新授权码后（reload）和定时器发现文件变化时（refresh）读取，
+    记住授权码是否匹配和到期日期；其余时候只用当前日期与到期日期比较，日期变化时无需读取文件。
+    时间防篡改检查由调用方负责。
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.code_ok = False
+        self.expire = None
+        self.machine_code = None
+        self.file_stamp = None  # 上次读取时授权文件的 (大小, 修改时间)，文件不存在时为 None
+
+    @staticmethod
+    def get_file_stamp():
+        try:
+            stat_result = os.stat(get_auth_path())
+        except OSError:
+            return None
+        return stat_result.st_size, stat_result.st_mtime_ns
+
+    def reload(self, quiet=False):
+        """重新读取授权文件"""
+        if self.machine_code is None:
+            self.machine_code = get_machine_code()
+        code_ok, expire = False, None
+        self.file_stamp = self.get_file_stamp()
+        auth_info = load_auth_info(quiet)
+        if auth_info and auth_info.get("machine_code") == self.machine_code:
+            expire = str(auth_info.get("expire", ""))
+            code_ok = expected_auth_code(self.machine_code, expire) == str(auth_info.get("auth_code", "")).upper()
+        self.code_ok, self.expire, self.loaded = code_ok, expire, True
+
+    def refresh(self):
+        """定时器调用：授权文件的大小和修改时间都没变时不读取；读取出错只打印日志"""
+        if self.loaded and self.get_file_stamp() == self.file_stamp:
+            return
+        self.reload(quiet=True)
+
+    def is_valid(self):
+        if not self.loaded:
+            self.reload()
+        return self.code_ok and datetime.datetime.now().strftime("%Y%m%d") <= self.expire
+
+
+LICENSE_SESSION = LicenseSession()
+
+
 def is_auth_valid():
     # 检查授权有效性前先验证时间
     if not check_time_tampering():
         QMessageBox.critical(None, "时间异常", "系统时间可能被篡改，授权验证失败")
         return False
+    return LICENSE_SESSION.is_valid()
 
-    machine_code = get_machine_code()
-    auth_info = load_auth_info()
-    if auth_info and auth_info.get("machine_code") == machine_code:
-        valid, _ = verify_auth_code(machine_code, auth_info["auth_code"], auth_info["expire"])
-        return valid
-    return False
 
-
-# ---------------- 解密函数 ----------------
-def decrypt_file(encrypted_path):
-    try:
-        if not os.path.exists(encrypted_path):
-            raise FileNotFoundError(f"加密文件不存在: {encrypted_path}")
-        with open(encrypted_path, "rb") as f:
-            enc_data = f.read()
-        return base64.b64decode(enc_data)
-    except Exception as e:
-        raise ValueError(f"解密失败: {str(e)}")
+# ---------------- 文档标识 ----------------
+def get_document_id(encrypted_path):
+    """加密文件的标识（路径+大小+修改时间），文件内容更新后标识随之改变，用作缓存键"""
+    stat_result = os.stat(encrypted_path)
+    return f"{os.path.abspath(encrypted_path)}|{stat_result.st_size}|{stat_result.st_mtime_ns}"
 
 
 # ---------------- 授权窗口 ----------------
@@ -248,6 +361,7 @@ class AuthDialog(QDialog):
             valid, msg = verify_auth_code(machine_code, code_input, expire_str)
             if valid:
                 save_auth_info(machine_code, code_input, expire_str)
+                LICENSE_SESSION.reload()
                 QMessageBox.information(self, "成功", msg)
                 self.accept()
             else:
@@ -260,7 +374,29 @@ class AuthDialog(QDialog):
 class PDFBrowser(QWidget):
     def __init__(self):
         super().__init__()
-        self.temp_pdf = None  # 临时文件路径
+        self.doc_buffer = None  # 当前文档的解密缓冲区（只在内存中）
+        self.doc_id = None  # 当前文档的缓存标识
+        self.doc_pool = DocumentPool(DOC_POOL_SIZE, DOC_POOL_MB)
+        self.doc_hashes = {}  # 文档标识 -> 缩略图缓存键（由后台打开时算好）
+        # 定时保存时间水位线
+        self.clock_save_timer = QTimer(self)
+        self.clock_save_timer.timeout.connect(CLOCK_GUARD.save)
+        self.clock_save_timer.start(LAST_RUN_SAVE_INTERVAL_MS)
+        # 定时检查授权文件，有变化时才重新读取；打开文件时只比较缓存的到期日期
+        self.license_timer = QTimer(self)
+        self.license_timer.timeout.connect(LICENSE_SESSION.refresh)
+        self.license_timer.start(LICENSE_RELOAD_INTERVAL_MS)
+        self.pending_open = None  # 正在后台打开的 (文档标识, 加密文件路径, 目录项, 预览文件)
+        # 在后台解密、解析当前要打开的文档，界面保持响应
+        self.loader = DocumentLoader(CONTAINER_KEY, MEMORY_OPEN_LIMIT_MB * 1024 * 1024, parent=self)
+        self.loader.loaded.connect(self.on_document_loaded)
+        self.loader.failed.connect(self.on_document_failed)
+        # 空闲时预取相邻文件
+        self.prefetcher = DocumentLoader(CONTAINER_KEY, MEMORY_OPEN_LIMIT_MB * 1024 * 1024,
+                                         delay=PREFETCH_DELAY, parent=self)
+        self.prefetcher.loaded.connect(self.on_prefetched)
+        self.prefetcher.failed.connect(self.on_prefetch_failed)
+        self.prefetcher.skipped.connect(self.on_prefetch_failed)
         self.init_ui()
 
     def init_ui(self):
@@ -289,7 +425,22 @@ class PDFBrowser(QWidget):
         self.fullscreen_btn = QPushButton("全屏/退出全屏")
         self.fullscreen_btn.clicked.connect(self.toggle_fullscreen)
         top_layout.addWidget(self.fullscreen_btn)
+
+        # 适合宽度按钮（窗口大小变化时自动保持页面宽度与视图一致）
+        self.fit_width_btn = QPushButton("适合宽度")
+        self.fit_width_btn.clicked.connect(self.fit_to_width)
+        top_layout.addWidget(self.fit_width_btn)
         top_layout.addStretch()
+
+        # 打开文档时的忙碌提示
+        self.loading_label = QLabel("正在打开...")
+        self.loading_bar = QProgressBar()
+        self.loading_bar.setRange(0, 0)
+        self.loading_bar.setMaximumWidth(160)
+        top_layout.addWidget(self.loading_label)
+        top_layout.addWidget(self.loading_bar)
+        self.loading_label.hide()
+        self.loading_bar.hide()
         main_layout.addWidget(top_widget)
 
         # 分割器
@@ -301,16 +452,22 @@ class PDFBrowser(QWidget):
         self.splitter.addWidget(self.tree)
         self.tree.itemClicked.connect(self.open_encrypted_pdf)
 
+        # 缩略图侧栏
+        self.thumb_cache = thumb_cache.ThumbnailCache(
+            os.path.join(os.path.expanduser("~"), THUMB_CACHE_DIR), CONTAINER_KEY, THUMB_CACHE_MB)
+        self.thumbnail_panel = ThumbnailPanel([self.thumb_cache])
+        self.thumbnail_panel.setMinimumWidth(thumb_cache.THUMB_WIDTH + 40)
+        self.thumbnail_panel.page_selected.connect(self.go_to_page)
+        self.splitter.addWidget(self.thumbnail_panel)
+
         # 右侧PDF显示
-        self.scroll_area = QScrollArea()
-        self.pdf_container = QWidget()
-        self.pdf_layout = QVBoxLayout()
-        self.pdf_container.setLayout(self.pdf_layout)
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setWidget(self.pdf_container)
-        self.splitter.addWidget(self.scroll_area)
-
-        self.splitter.setSizes([120, 1080])
+        # 只渲染可见页面的虚拟化视图，其余页面显示占位框
+        self.page_view = PageView(cache_mb=PAGE_CACHE_MB)
+        self.page_view.zoom_changed.connect(self.on_zoom_changed)
+        self.page_view.verticalScrollBar().valueChanged.connect(self.on_page_scrolled)
+        self.splitter.addWidget(self.page_view)
+
+        self.splitter.setSizes([120, 170, 910])
         main_layout.addWidget(self.splitter, 1)
         self.setLayout(main_layout)
 
@@ -325,6 +482,18 @@ class PDFBrowser(QWidget):
     def load_encrypted_tree(self):
         self.tree.clear()
         enc_folder = get_resource_path("encrypted_files")
+
+        # 有加密工具生成的目录索引时一次建好目录树，不再逐个目录遍历
+        nodes = tree_index.load_index(enc_folder, CONTAINER_KEY) if enc_folder else None
+        if nodes is not None:
+            try:
+                self.tree.addTopLevelItems(self.build_tree_items(nodes))
+                self.tree.expandAll()
+                return
+            except (TypeError, ValueError, IndexError) as e:
+                print(f"目录索引格式错误，改为遍历目录: {str(e)}")
+                self.tree.clear()
+
         if not enc_folder or not os.path.exists(enc_folder):
             QMessageBox.warning(self, "目录错误", f"加密文件目录不存在: {enc_folder}")
             return
@@ -363,11 +532,34 @@ class PDFBrowser(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "加载错误", f"加载目录失败: {str(e)}")
 
+    def build_tree_items(self, nodes):
+        """由目录索引的节点列表生成目录树条目，文件条目的提示中显示大小和页数"""
+        items = []
+        for node in nodes:
+            item = QTreeWidgetItem([node[0]])
+            if len(node) == 2:
+                item.addChildren(self.build_tree_items(node[1]))
+            else:
+                _, size, pages = node
+                details = []
+                if size is not None:
+                    details.append(f"{size / (1024 * 1024):.1f} MB")
+                if pages is not None:
+                    details.append(f"{pages} 页")
+                if details:
+                    item.setToolTip(0, "，".join(details))
+            items.append(item)
+        return items
+
     def open_encrypted_pdf(self, item, column):
         # 打开文件前先检查时间是否正常
         if not check_time_tampering():
             QMessageBox.critical(self, "时间异常", "系统时间可能被篡改，无法打开文件")
             return
+        # 程序长时间运行期间授权可能到期（只比较缓存的到期日期，不读取文件）
+        if not LICENSE_SESSION.is_valid():
+            QMessageBox.critical(self, "授权失效", "授权已过期或无效，请重新启动程序验证授权")
+            return
 
         # 清理之前的临时文件
         self.clean_temp_file()
@@ -379,25 +571,68 @@ class PDFBrowser(QWidget):
                 QMessageBox.warning(self, "文件错误", "未找到有效的加密文件")
                 return
 
-            # 解密文件
-            decrypted_data = decrypt_file(enc_path)
-            if not decrypted_data:
-                QMessageBox.warning(self, "解密错误", "解密后文件为空")
+            doc_id = get_document_id(enc_path)
+            preview = thumb_cache.load_preview(enc_path, CONTAINER_KEY)
+            self.doc_pool.set_active(doc_id)
+            pooled = self.doc_pool.get(doc_id)
+            if pooled is not None:
+                # 最近打开过且文件未变，直接使用缓存池中已解析的文档
+                doc, buffer, page_sizes = pooled
+                self.show_document(doc_id, doc, buffer, page_sizes, enc_path, item, preview)
                 return
 
-            # 在系统临时目录创建临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', mode='wb') as f:
-                f.write(decrypted_data)
-                self.temp_pdf = f.name
+            # 有加密工具生成的预览文件时先显示首页预览和缩略图；解密和解析在后台进行，
+            # 明文只在内存缓冲区中，不写入磁盘
+            self.show_preview(preview)
+            self.pending_open = (doc_id, enc_path, item, preview)
+            self.set_loading(True)
+            self.prefetcher.cancel()
+            if self.prefetcher.current != doc_id:
+                self.loader.request([(doc_id, enc_path)], self.page_view.viewport().width())
+            # 否则该文件正在预取，等待预取结果（on_prefetched），不重复解密
 
-            # 打开PDF
-            self.doc = fitz.open(self.temp_pdf)
-            self.show_all_pages()
+        except Exception as e:
+            QMessageBox.critical(self, "打开失败", f"无法打开文件: {str(e)}")
+            self.clean_temp_file()
 
+    def set_loading(self, loading):
+        self.loading_label.setVisible(loading)
+        self.loading_bar.setVisible(loading)
+
+    def on_document_loaded(self, result):
+        """后台打开完成：首页已渲染好，立即显示，其余页面滚动到附近时再渲染"""
+        if self.pending_open is None or self.pending_open[0] != result.doc_id:
+            # 期间已切换到其他文件，结果留在缓存池中备用
+            self.on_prefetched(result)
+            return
+        doc_id, enc_path, item, preview = self.pending_open
+        self.pending_open = None
+        self.set_loading(False)
+        try:
+            # 交给缓存池管理
+            self.doc_hashes[doc_id] = result.doc_hash
+            self.doc_pool.put(doc_id, result.doc, result.buffer, result.page_sizes)
+            if result.first_page is not None:
+                self.page_view.cache.put((doc_id, 0, result.zoom, None), result.first_page)
+            self.show_document(doc_id, result.doc, result.buffer, result.page_sizes, enc_path, item, preview)
         except Exception as e:
             QMessageBox.critical(self, "打开失败", f"无法打开文件: {str(e)}")
             self.clean_temp_file()
 
+    def on_document_failed(self, doc_id, message):
+        if self.pending_open is None or self.pending_open[0] != doc_id:
+            return
+        self.pending_open = None
+        self.set_loading(False)
+        QMessageBox.critical(self, "打开失败", f"无法打开文件: {message}")
+        self.clean_temp_file()
+
+    def show_document(self, doc_id, doc, buffer, page_sizes, enc_path, item, preview):
+        self.doc, self.doc_buffer, self.doc_id = doc, buffer, doc_id
+        self.show_all_pages(page_sizes=page_sizes)
+        self.show_thumbnails(self.doc_hashes.get(doc_id), preview)
+        self.prefetch_siblings(item)
+
     def get_encrypted_item_path(self, item):
         names = []
         current_item = item
@@ -413,68 +648,101 @@ class PDFBrowser(QWidget):
         names[-1] = enc_filename
         return get_resource_path(os.path.join("encrypted_files", *names))
 
-    def show_all_pages(self):
-        # 清空现有页面
-        for i in reversed(range(self.pdf_layout.count())):
-            widget = self.pdf_layout.itemAt(i).widget()
-            if widget:
-                self.pdf_layout.removeWidget(widget)
-                widget.deleteLater()
-
-        if not self.doc:
+    def prefetch_siblings(self, item):
+        """在后台预取同一目录中其后的几个文件（通常会按顺序阅读）"""
+        parent = item.parent()
+        if parent is not None:
+            siblings = [parent.child(i) for i in range(parent.indexOfChild(item) + 1, parent.childCount())]
+        else:
+            index = self.tree.indexOfTopLevelItem(item)
+            siblings = [self.tree.topLevelItem(i) for i in range(index + 1, self.tree.topLevelItemCount())]
+
+        jobs = []
+        for sibling in siblings:
+            if len(jobs) >= PREFETCH_COUNT:
+                break
+            enc_path = self.get_encrypted_item_path(sibling)
+            if sibling.childCount() or not os.path.isfile(enc_path):
+                continue
+            doc_id = get_document_id(enc_path)
+            if doc_id not in self.doc_pool:
+                jobs.append((doc_id, enc_path))
+        self.prefetcher.request(jobs, self.page_view.viewport().width(), PREFETCH_MB * 1024 * 1024)
+
+    def on_prefetched(self, result):
+        """预取完成：文档放入缓存池，首页图像放入页面缓存；正在等待打开该文件时直接显示"""
+        if self.pending_open is not None and self.pending_open[0] == result.doc_id:
+            self.loader.cancel()
+            self.on_document_loaded(result)
             return
-
+        if result.doc_id in self.doc_pool:
+            close_document(result.doc, result.buffer)
+            return
+        self.doc_hashes[result.doc_id] = result.doc_hash
+        self.doc_pool.put(result.doc_id, result.doc, result.buffer, result.page_sizes)
+        if result.first_page is not None and result.doc_id in self.doc_pool:
+            self.page_view.cache.put((result.doc_id, 0, result.zoom, None), result.first_page)
+
+    def on_prefetch_failed(self, doc_id, message=""):
+        """预取失败或因内存预算跳过：正在等待打开该文件时改为正常打开"""
+        if self.pending_open is not None and self.pending_open[0] == doc_id:
+            self.loader.request([(doc_id, self.pending_open[1])], self.page_view.viewport().width())
+
+    def show_preview(self, preview):
+        """显示预览文件中的页面布局、首页预览图和缩略图"""
+        if preview is None or not preview.page_count:
+            return
+        previews = {}
+        first_page = QImage.fromData(preview.first_page, "PNG")
+        if not first_page.isNull():
+            previews[0] = first_page
+        self.page_view.show_preview(preview.page_sizes, previews)
+        self.thumbnail_panel.set_document(None, preview=preview)
+
+    def show_all_pages(self, page_sizes=None):
+        """显示当前文档（按宽度自适应，页面在滚动到附近时才渲染）
+
+        首页图像已在缓存中时立即显示；还没有时，预览文件中的首页预览图保留到清晰版本渲染完成。
+        """
         try:
-            # 自适应宽度
-            container_width = self.scroll_area.viewport().width() - 20
-            for page_idx in range(self.doc.page_count):
-                page = self.doc.load_page(page_idx)
-                zoom = container_width / page.rect.width
-                mat = fitz.Matrix(zoom, zoom)
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-                lbl = QLabel()
-                lbl.setPixmap(QPixmap.fromImage(img))
-                lbl.setAlignment(Qt.AlignCenter)
-                lbl.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-                self.pdf_layout.addWidget(lbl)
-            self.pdf_layout.addStretch()
+            previews = {}
+            if 0 in self.page_view.images and self.page_view.doc is None:
+                previews[0] = self.page_view.images[0][1]
+            self.page_view.set_document(self.doc, self.doc_buffer, self.doc_id, previews, page_sizes)
+            self.zoom = self.page_view.zoom
         except Exception as e:
             QMessageBox.warning(self, "显示错误", f"无法显示PDF页面: {str(e)}")
 
+    def show_thumbnails(self, doc_hash, preview=None):
+        """显示缩略图侧栏（优先使用预览文件中的缩略图，其次按缓存键查找磁盘缓存，不读取加密文件）"""
+        if preview is not None and preview.page_count == self.doc.page_count:
+            doc_hash = None
+        else:
+            preview = None
+        self.thumbnail_panel.set_document(self.doc, self.doc_buffer, doc_hash, preview)
+
+    def go_to_page(self, page_idx):
+        self.page_view.scroll_to_page(page_idx)
+
+    def on_page_scrolled(self, value):
+        if self.doc is not None:
+            self.thumbnail_panel.set_current_page(self.page_view.current_page())
+
     def wheelEvent(self, event):
         if not self.doc:
             return
         angle = event.angleDelta().y()
         if event.modifiers() & Qt.ControlModifier:
-            self.zoom *= 1.1 if angle > 0 else 0.9
-            self.show_all_pages_with_zoom()
+            # 连续的滚轮事件合并为一次缩放，停止滚动后才渲染
+            self.page_view.zoom_controller.wheel(angle)
         else:
             super().wheelEvent(event)
 
-    def show_all_pages_with_zoom(self):
-        for i in reversed(range(self.pdf_layout.count())):
-            widget = self.pdf_layout.itemAt(i).widget()
-            if widget:
-                self.pdf_layout.removeWidget(widget)
-                widget.deleteLater()
+    def on_zoom_changed(self, zoom):
+        self.zoom = zoom
 
-        if not self.doc:
-            return
-
-        try:
-            for page_idx in range(self.doc.page_count):
-                page = self.doc.load_page(page_idx)
-                mat = fitz.Matrix(self.zoom, self.zoom)
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                img = QImage(pix.samples, pix.width, pix.height, pix.stride, QImage.Format_RGB888)
-                lbl = QLabel()
-                lbl.setPixmap(QPixmap.fromImage(img))
-                lbl.setAlignment(Qt.AlignCenter)
-                self.pdf_layout.addWidget(lbl)
-            self.pdf_layout.addStretch()
-        except Exception as e:
-            QMessageBox.warning(self, "缩放错误", f"缩放页面失败: {str(e)}")
+    def fit_to_width(self):
+        self.page_view.fit_to_width()
 
     def toggle_fullscreen(self):
         if self.fullscreen_flag:
@@ -487,17 +755,30 @@ class PDFBrowser(QWidget):
             self.fullscreen_flag = True
 
     def clean_temp_file(self):
-        """清理临时PDF文件"""
-        if hasattr(self, 'temp_pdf') and self.temp_pdf and os.path.exists(self.temp_pdf):
-            try:
-                os.remove(self.temp_pdf)
-            except Exception as e:
-                print(f"清理临时文件失败: {str(e)}")
-        self.temp_pdf = None
+        """不再显示当前文档（明文只在内存中，无需删除临时文件）
+
+        缓存池中的文档留待切回时使用，由缓存池按最近使用顺序关闭；其余的直接关闭并释放缓冲区。
+        """
+        self.pending_open = None
+        self.set_loading(False)
+        self.loader.cancel()
+        self.page_view.clear()
+        self.thumbnail_panel.set_document(None)
+        if self.doc_id is None or self.doc_id not in self.doc_pool:
+            close_document(self.doc, self.doc_buffer)
         self.doc = None
+        self.doc_buffer = None
+        self.doc_id = None
+        self.doc_pool.set_active(None)
 
     def closeEvent(self, event):
+        self.loader.shutdown()
+        self.prefetcher.shutdown()
+        self.page_view.shutdown()
+        self.thumbnail_panel.shutdown()
         self.clean_temp_file()
+        self.doc_pool.clear()
+        CLOCK_GUARD.save()
         event.accept()
 
 
@@ -508,6 +789,7 @@ def main():
         if not check_time_tampering():
             QMessageBox.critical(None, "时间异常", "系统时间可能被篡改，程序无法启动")
             sys.exit(1)
+        CLOCK_GUARD.save()
 
         app = QApplication(sys.argv)
         # 确保中文显示正常
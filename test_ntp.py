@@ -1,8 +1,14 @@
-import socket
-import struct
+import argparse
+import asyncio
 import datetime
+import json
+import math
+import os
+import statistics
 import time
 
+from trusted_time import NTP_PORT, NTP_SERVERS_FILE, query_server, server_address, server_label
+
 # 国内常用NTP服务器列表
 NTP_SERVERS = [
     "ntp.aliyun.com",  # 阿里云
@@ -14,74 +20,135 @@ NTP_SERVERS = [
     "ntp2.baidu.com"  # 百度节点2
 ]
 
-NTP_PORT = 123
-NTP_PACKET_FORMAT = "!12I"
-NTP_DELTA = 2208988800  # 1970-01-01到1900-01-01的秒数
-BEIJING_TIME_DELTA = datetime.timedelta(hours=8)  # 北京时间UTC+8
+PROBE_COUNT = 8  # 每个服务器的探测次数
+PROBE_INTERVAL = 0.5  # 同一服务器两次探测的间隔（秒），避免触发服务器的限速
+PROBE_TIMEOUT = 3.0  # 单次探测的超时（秒）
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), NTP_SERVERS_FILE)  # 查看器从程序目录读取
+
+
+def percentile(values, p):
+    """最近秩法百分位数，values 已排序"""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "min": round(values[0], 2),
+        "median": round(statistics.median(values), 2),
+        "p95": round(percentile(values, 95), 2)
+    }
+
+
+async def probe_server(server, count=PROBE_COUNT, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, port=NTP_PORT):
+    """对一个服务器探测 count 次，统计延迟和本地时钟偏差（毫秒）"""
+    host, server_port = server_address(server, port)
+    delays = []
+    offsets = []
+    errors = []
+    for i in range(count):
+        if i:
+            await asyncio.sleep(interval)
+        try:
+            offset, delay = await asyncio.wait_for(query_server((host, server_port)), timeout)
+        except asyncio.TimeoutError:
+            errors.append("超时")
+            continue
+        except (OSError, ValueError) as e:
+            errors.append(str(e))
+            continue
+        delays.append(delay * 1000)
+        offsets.append(offset * 1000)
+
+    result = {
+        "server": server_label((host, server_port)),
+        "host": host,
+        "port": server_port,
+        "sent": count,
+        "received": len(delays),
+        "available": bool(delays)
+    }
+    if delays:
+        result["delay_ms"] = summarize(delays)
+        result["offset_ms"] = summarize(offsets)
+    else:
+        # 出现次数最多的错误作为原因
+        result["error"] = max(set(errors), key=errors.count) if errors else "无响应"
+    return result
 
 
-def test_ntp_server(server):
-    """测试单个NTP服务器是否可用"""
-    try:
-        # 创建UDP socket
-        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client.settimeout(3)  # 3秒超时
+async def survey(servers, count=PROBE_COUNT, interval=PROBE_INTERVAL, timeout=PROBE_TIMEOUT, port=NTP_PORT):
+    """同时探测所有服务器，返回各服务器的统计结果（按输入顺序）"""
+    return await asyncio.gather(*(probe_server(server, count, interval, timeout, port) for server in servers))
 
-        # 构建NTP请求包
-        data = b'\x1b' + 47 * b'\0'
-        client.sendto(data, (server, NTP_PORT))
 
-        # 接收响应
-        start_time = time.time()
-        response, _ = client.recvfrom(1024)
-        end_time = time.time()
-        client.close()
+def rank(results):
+    """可用的服务器按丢包率、延迟中位数、延迟 p95 排序"""
+    available = [r for r in results if r["available"]]
+    return sorted(available, key=lambda r: (1 - r["received"] / r["sent"],
+                                            r["delay_ms"]["median"], r["delay_ms"]["p95"]))
 
-        # 计算延迟（毫秒）
-        delay = (end_time - start_time) * 1000
 
-        # 解析NTP响应
-        unpacked = struct.unpack(NTP_PACKET_FORMAT, response[0:48])
-        transmit_timestamp = unpacked[10] + float(unpacked[11]) / 2 ** 32
-        utc_time = datetime.datetime.utcfromtimestamp(transmit_timestamp - NTP_DELTA)
-        beijing_time = utc_time + BEIJING_TIME_DELTA
+def save_ranking(path, ranked, count):
+    """写出排好序的服务器列表，查看器启动时按这个顺序使用"""
+    data = {
+        "generated": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "probes": count,
+        "servers": ranked
+    }
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
-        return {
-            "server": server,
-            "available": True,
-            "delay_ms": round(delay, 2),
-            "beijing_time": beijing_time.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        }
 
-    except socket.timeout:
-        return {"server": server, "available": False, "error": "超时"}
-    except Exception as e:
-        return {"server": server, "available": False, "error": str(e)}
+def parse_server(text):
+    """命令行中的服务器可以写成 主机 或 主机:端口"""
+    host, sep, port = text.rpartition(":")
+    return (host, int(port)) if sep and port.isdigit() else text
 
 
-def main():
-    print("开始测试国内NTP服务器可用性...\n")
-    results = []
+def format_stats(stats):
+    return f"{stats['min']}/{stats['median']}/{stats['p95']}"
 
-    for server in NTP_SERVERS:
-        print(f"测试 {server} ...", end=" ")
-        result = test_ntp_server(server)
-        results.append(result)
 
-        if result["available"]:
-            print(f"可用 | 延迟: {result['delay_ms']}ms | 时间: {result['beijing_time']}")
+def main():
+    parser = argparse.ArgumentParser(description="并发测试NTP服务器的延迟和时钟偏差，生成排好序的服务器列表")
+    parser.add_argument("servers", nargs="*", help="要测试的服务器，可写成 主机:端口（默认为内置列表）")
+    parser.add_argument("-n", "--count", type=int, default=PROBE_COUNT, help="每个服务器的探测次数")
+    parser.add_argument("--interval", type=float, default=PROBE_INTERVAL, help="同一服务器两次探测的间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT, help="单次探测的超时（秒）")
+    parser.add_argument("--port", type=int, default=NTP_PORT, help="NTP端口")
+    parser.add_argument("-o", "--output", default=OUTPUT_PATH, help="服务器列表的输出文件")
+    args = parser.parse_args()
+
+    servers = [parse_server(server) for server in args.servers] or NTP_SERVERS
+    count = max(1, args.count)
+    print(f"开始测试 {len(servers)} 个NTP服务器（每个探测 {count} 次）...\n")
+    start_time = time.perf_counter()
+    results = asyncio.run(survey(servers, count, args.interval, args.timeout, args.port))
+    elapsed = time.perf_counter() - start_time
+
+    print(f"{'服务器':<24}{'收到':>6}  {'延迟ms 最小/中位/p95':<26}{'偏差ms 最小/中位/p95'}")
+    for r in results:
+        if r["available"]:
+            print(f"{r['server']:<24}{r['received']:>3}/{r['sent']:<3} "
+                  f"{format_stats(r['delay_ms']):<26}{format_stats(r['offset_ms'])}")
         else:
-            print(f"不可用 | 原因: {result['error']}")
+            print(f"{r['server']:<24}{0:>3}/{r['sent']:<3} 不可用 | 原因: {r['error']}")
+    print(f"\n测试用时 {elapsed:.1f} 秒")
 
     # 汇总可用服务器
-    available_servers = [r for r in results if r["available"]]
-    if available_servers:
-        print("\n可用服务器列表（按延迟排序）:")
-        for r in sorted(available_servers, key=lambda x: x["delay_ms"]):
-            print(f"- {r['server']} (延迟: {r['delay_ms']}ms)")
+    ranked = rank(results)
+    if ranked:
+        print("\n可用服务器列表（按丢包率和延迟排序）:")
+        for r in ranked:
+            print(f"- {r['server']} (延迟中位数: {r['delay_ms']['median']}ms)")
+        save_ranking(args.output, ranked, count)
+        print(f"\n已写入 {args.output}")
     else:
-        print("\n没有可用的NTP服务器")
+        print("\n没有可用的NTP服务器，未写入服务器列表")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,239 @@
+"""
+页面缩略图的磁盘缓存与预览文件，供查看器 pdfviewer.py 与加密工具 generate_gui.py 共用。
+
+缩略图按 .enc 文件的缓存键（document_key）与页码索引，文件改名或移动后仍能命中，重新加密后自动失效。
+每张缩略图是一段 PNG，用容器密钥经 AES-GCM 加密后存盘（附加认证数据包含文档摘要、页码和宽度，
+缩略图不能被调换到其他页面）。
+
+目录结构：<缓存目录>/<文档摘要>/<页码>_<宽度>.thumb。
+缓存超过上限时按最近使用时间（读取时更新文件修改时间）淘汰最旧的缩略图。
+
+预览文件（<名称>.pdf.enc.preview）由加密工具打包时生成，与 .enc 放在一起分发，
+内含各页尺寸、全部页面的缩略图和一张较清晰的首页预览图，整体用容器密钥加密。
+查看器打开文档时先读取这个小文件，不必解密和解析整个PDF就能显示首页和缩略图栏。
+预览文件与 .enc 的大小和头部绑定，.enc 重新生成后旧的预览文件自动失效。
+"""
+import os
+import json
+import hashlib
+import struct
+
+import fitz  # PyMuPDF
+
+import enc_container
+
+THUMB_WIDTH = 120  # 缩略图宽度（像素）
+THUMB_SUFFIX = ".thumb"
+HASH_CHUNK_SIZE = 1024 * 1024
+PREVIEW_SUFFIX = ".preview"
+PREVIEW_WIDTH = 1000  # 首页预览图宽度（像素）
+
+
+def content_hash(path):
+    """文件内容的 SHA-256（十六进制）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def document_key(enc_path):
+    """.enc 文件的缓存键（十六进制），由后台线程调用
+
+    新版容器取头部的 SHA-256：头部含每次加密随机生成的 nonce 前缀，只需读取头部即可区分每次加密的结果。
+    旧版Base64文件没有头部，计算整个文件的内容摘要。
+    """
+    with open(enc_path, "rb") as f:
+        head = f.read(enc_container.HEADER_SIZE)
+    if head[:len(enc_container.MAGIC)] == enc_container.MAGIC:
+        return hashlib.sha256(b"pdf-enc-header|" + head).hexdigest()
+    return content_hash(enc_path)
+
+
+def render_thumbnail(doc, page_idx, width=THUMB_WIDTH):
+    """把一页渲染为指定宽度的 PNG 数据"""
+    page = doc.load_page(page_idx)
+    zoom = width / max(page.rect.width, 1)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes("png")
+
+
+class ThumbnailCache:
+    """加密存储的缩略图目录，max_mb 为 0 时不限制大小
+
+    各方法都会读写磁盘，且不是线程安全的：查看器只在缩略图侧栏的缓存线程（ThumbnailCacheWorker）中调用。
+    """
+
+    def __init__(self, cache_dir, key, max_mb, width=THUMB_WIDTH):
+        self.cache_dir = cache_dir
+        self.key = key
+        self.budget = max_mb * 1024 * 1024
+        self.width = width
+        self.used = None  # 首次写入时统计
+
+    def thumb_path(self, doc_hash, page_idx):
+        return os.path.join(self.cache_dir, doc_hash, f"{page_idx}_{self.width}{THUMB_SUFFIX}")
+
+    def _aad(self, doc_hash, page_idx):
+        return f"{doc_hash}|{page_idx}|{self.width}".encode()
+
+    def get(self, doc_hash, page_idx):
+        """返回缩略图 PNG 数据，不存在或已损坏时返回 None"""
+        path = self.thumb_path(doc_hash, page_idx)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+        try:
+            data = enc_container.unseal(self.key, blob, self._aad(doc_hash, page_idx))
+        except ValueError:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, doc_hash, page_idx, data):
+        path = self.thumb_path(doc_hash, page_idx)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob = enc_container.seal(self.key, data, self._aad(doc_hash, page_idx))
+        tmp_path = path + ".part"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        if self.budget:
+            if self.used is None:
+                self.used = sum(size for _, _, size in self._scan())
+            else:
+                self.used += len(blob) - old_size
+            if self.used > self.budget:
+                self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰最旧的缩略图，直到占用降到上限的九成"""
+        entries = sorted(self._scan())
+        self.used = sum(size for _, _, size in entries)
+        target = self.budget * 0.9
+        for _, path, size in entries:
+            if self.used <= target:
+                break
+            self._remove(path)
+            self.used -= size
+
+    def _scan(self):
+        """返回 [(修改时间, 路径, 大小), ...]"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for doc_hash in os.listdir(self.cache_dir):
+            doc_dir = os.path.join(self.cache_dir, doc_hash)
+            if not os.path.isdir(doc_dir):
+                continue
+            for name in os.listdir(doc_dir):
+                if name.endswith(THUMB_SUFFIX):
+                    path = os.path.join(doc_dir, name)
+                    try:
+                        stat_result = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat_result.st_mtime_ns, path, stat_result.st_size))
+        return entries
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            doc_dir = os.path.dirname(path)
+            if not os.listdir(doc_dir):
+                os.rmdir(doc_dir)
+        except OSError:
+            pass
+
+
+# ---------------- 预览文件 ----------------
+def get_preview_path(enc_path):
+    return enc_path + PREVIEW_SUFFIX
+
+
+def _preview_aad(enc_path):
+    """把预览文件绑定到 .enc 的大小和头部（新版容器头部含随机 nonce，每次加密都不同）"""
+    with open(enc_path, "rb") as f:
+        head = f.read(enc_container.HEADER_SIZE)
+        size = os.fstat(f.fileno()).st_size
+    return b"pdf-preview|" + str(size).encode() + b"|" + head
+
+
+class DocumentPreview:
+    """解密后的预览文件：页数、各页尺寸（点）、首页预览图和缩略图（均为 PNG 数据）"""
+
+    def __init__(self, payload):
+        index_size = struct.unpack(">I", payload[:4])[0]
+        index = json.loads(payload[4:4 + index_size].decode("utf-8"))
+        self._data = memoryview(payload)[4 + index_size:]
+        self.page_sizes = [tuple(size) for size in index["pages"]]
+        self.thumb_width = index["thumb_width"]
+        self._first_page = index["first_page"]
+        self._thumbs = index["thumbs"]
+
+    @property
+    def page_count(self):
+        return len(self.page_sizes)
+
+    @property
+    def first_page(self):
+        offset, length = self._first_page
+        return bytes(self._data[offset:offset + length])
+
+    def thumbnail(self, page_idx):
+        if not 0 <= page_idx < len(self._thumbs):
+            return None
+        offset, length = self._thumbs[page_idx]
+        return bytes(self._data[offset:offset + length])
+
+
+def write_preview(src_path, enc_path, key, thumb_width=THUMB_WIDTH, preview_width=PREVIEW_WIDTH):
+    """从源PDF渲染各页缩略图和首页预览图，加密写入 .enc 旁的预览文件"""
+    blobs = []
+    offset = 0
+
+    def add(data):
+        nonlocal offset
+        blobs.append(data)
+        offset += len(data)
+        return [offset - len(data), len(data)]
+
+    with fitz.open(src_path) as doc:
+        pages = [[page.rect.width, page.rect.height] for page in doc]
+        first_page = add(render_thumbnail(doc, 0, preview_width)) if doc.page_count else [0, 0]
+        thumbs = [add(render_thumbnail(doc, page_idx, thumb_width)) for page_idx in range(doc.page_count)]
+
+    index = json.dumps({"pages": pages, "thumb_width": thumb_width,
+                        "first_page": first_page, "thumbs": thumbs}).encode("utf-8")
+    payload = struct.pack(">I", len(index)) + index + b"".join(blobs)
+    preview_path = get_preview_path(enc_path)
+    tmp_path = preview_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(enc_container.seal(key, payload, _preview_aad(enc_path)))
+    os.replace(tmp_path, preview_path)
+
+
+def load_preview(enc_path, key):
+    """读取 .enc 的预览文件，不存在、已过期或已损坏时返回 None"""
+    preview_path = get_preview_path(enc_path)
+    try:
+        with open(preview_path, "rb") as f:
+            blob = f.read()
+        return DocumentPreview(enc_container.unseal(key, blob, _preview_aad(enc_path)))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"预览文件无效: {preview_path} ({str(e)})")
+        return None
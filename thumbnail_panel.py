@@ -0,0 +1,259 @@
+"""
+缩略图侧栏
+
+列表中只为滚动到附近的页面加载缩略图：先查加密工具生成的预览文件，再查用户的磁盘缓存，
+都没有时由单独的 RenderService 在后台渲染，渲染结果写回磁盘缓存，下次打开直接显示。
+磁盘缓存的读取、解密、PNG 编解码、写入和淘汰都在 ThumbnailCacheWorker 的后台线程中进行，
+界面线程只接收解码好的 QImage（缓存目录可能在较慢的网络盘上）。
+"""
+import threading
+from collections import deque
+
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QListView, QAbstractItemView
+from PyQt5.QtCore import Qt, QTimer, QSize, QBuffer, QByteArray, QIODevice, QObject, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QIcon
+
+from page_view import RenderService
+from thumb_cache import THUMB_WIDTH
+
+THUMB_HEIGHT = int(THUMB_WIDTH * 1.5)  # 缩略图框的高度（按常见纵向页面的比例）
+PRELOAD_ROWS = 10  # 可见区域上下额外加载的缩略图数
+KEEP_ROWS = 100  # 离开可见区域超过该行数的缩略图释放图像
+
+
+class ThumbnailCacheWorker(QObject):
+    """在后台线程中读写缩略图磁盘缓存
+
+    lookup() 提交的查找会替换尚未开始的查找（滚动后旧的请求自动取消），store() 提交的写入全部保留；
+    查找优先于写入，可见的缩略图不会排在写缓存之后。
+    """
+    thumbnail_loaded = pyqtSignal(int, int, object)  # (代号, 页码, QImage，缓存中没有时为 None)
+
+    def __init__(self, caches, parent=None):
+        """caches 为按查找顺序排列的 ThumbnailCache，写入第一个"""
+        super().__init__(parent)
+        self.caches = caches
+        self._cond = threading.Condition()
+        self._lookups = deque()  # (代号, 文档摘要, 页码)
+        self._stores = deque()  # (文档摘要, 页码, QImage)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def lookup(self, generation, doc_hash, pages):
+        """按顺序查找 pages 中各页的缓存，替换所有尚未开始的查找"""
+        with self._cond:
+            self._lookups = deque((generation, doc_hash, page_idx) for page_idx in pages)
+            self._cond.notify_all()
+
+    def store(self, doc_hash, page_idx, image):
+        if not self.caches:
+            return
+        with self._cond:
+            self._stores.append((doc_hash, page_idx, image))
+            self._cond.notify_all()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._lookups.clear()
+            self._stores.clear()
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._lookups and not self._stores:
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                lookup = self._lookups.popleft() if self._lookups else None
+                store = self._stores.popleft() if lookup is None else None
+
+            try:
+                if lookup is not None:
+                    generation, doc_hash, page_idx = lookup
+                    self.thumbnail_loaded.emit(generation, page_idx, self._load(doc_hash, page_idx))
+                else:
+                    self._save(*store)
+            except Exception as e:
+                print(f"缩略图缓存读写失败: {str(e)}")
+
+    def _load(self, doc_hash, page_idx):
+        for cache in self.caches:
+            data = cache.get(doc_hash, page_idx)
+            if data is not None:
+                image = QImage.fromData(data, "PNG")
+                if not image.isNull():
+                    return image
+        return None
+
+    def _save(self, doc_hash, page_idx, image):
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "PNG")
+        try:
+            self.caches[0].put(doc_hash, page_idx, bytes(data))
+        except OSError as e:
+            print(f"保存缩略图缓存失败: {str(e)}")
+
+
+class ThumbnailPanel(QListWidget):
+    page_selected = pyqtSignal(int)  # 用户点击了某页的缩略图
+
+    def __init__(self, caches, parent=None):
+        """caches 为按查找顺序排列的 ThumbnailCache，渲染出的新缩略图写入第一个"""
+        super().__init__(parent)
+        self.doc = None
+        self.doc_hash = None
+        self.preview = None  # 预览文件（DocumentPreview），其中带有全部页面的缩略图
+        self.generation = 0
+        self.loaded = set()  # 已显示缩略图的页码
+        self.cache_misses = set()  # 磁盘缓存中确认没有、需要渲染的页码（当前文档）
+
+        self.setViewMode(QListView.IconMode)
+        self.setFlow(QListView.TopToBottom)
+        self.setWrapping(False)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(THUMB_WIDTH, THUMB_HEIGHT))
+        self.setSpacing(6)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.itemClicked.connect(lambda item: self.page_selected.emit(self.row(item)))
+
+        self.placeholder = QPixmap(THUMB_WIDTH, THUMB_HEIGHT)
+        self.placeholder.fill(Qt.white)
+
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.update_visible_thumbnails)
+        self.verticalScrollBar().valueChanged.connect(self.schedule_update)
+
+        self.render_service = RenderService(1, self)
+        self.render_service.page_rendered.connect(self.on_thumbnail_rendered)
+        self.cache_worker = ThumbnailCacheWorker(caches, self)
+        self.cache_worker.thumbnail_loaded.connect(self.on_thumbnail_loaded)
+
+    def set_document(self, doc, source=None, doc_hash=None, preview=None):
+        """显示文档的缩略图列表
+
+        doc_hash 为 .enc 文件的缓存键（thumb_cache.document_key，为空时不使用磁盘缓存）；doc 为空而 preview 不为空时，
+        只按预览文件显示缩略图（文档还在解密）。
+        """
+        self.doc = doc
+        if doc_hash != self.doc_hash:
+            self.cache_misses.clear()
+        self.doc_hash = doc_hash
+        self.generation = self.render_service.set_source(source if doc is not None else None)
+        if preview is not None and preview is self.preview:
+            # 同一份预览已经显示，保留已加载的缩略图
+            self.schedule_update()
+            return
+        self.clear()
+        self.loaded.clear()
+        self.cache_misses.clear()
+        self.preview = preview
+        page_count = doc.page_count if doc is not None else (preview.page_count if preview is not None else 0)
+        icon = QIcon(self.placeholder)
+        for page_idx in range(page_count):
+            self.addItem(QListWidgetItem(icon, str(page_idx + 1)))
+        if page_count:
+            self.update_visible_thumbnails()
+
+    def set_current_page(self, page_idx):
+        """跟随页面视图高亮当前页（不触发 page_selected）"""
+        if 0 <= page_idx < self.count() and page_idx != self.currentRow():
+            self.setCurrentRow(page_idx)
+            self.scrollToItem(self.item(page_idx))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_update()
+
+    def schedule_update(self):
+        if not self.update_timer.isActive():
+            self.update_timer.start(0)
+
+    def visible_rows(self):
+        """可见的行范围（各行高度相同，按第一行的位置和行距计算）"""
+        if not self.count():
+            return range(0)
+        first_rect = self.visualItemRect(self.item(0))
+        stride = first_rect.height() + 2 * self.spacing()
+        if self.count() > 1:
+            stride = max(1, self.visualItemRect(self.item(1)).top() - first_rect.top())
+        top = max(0, -first_rect.top() // stride)
+        bottom = min(self.count(), (self.viewport().height() - first_rect.top()) // stride + 1)
+        return range(top, max(top, bottom))
+
+    def update_visible_thumbnails(self):
+        """显示可见区域附近的缩略图：预览文件中有的直接显示，其余先到后台查磁盘缓存，
+        缓存中没有的再交给后台渲染；释放离得远的缩略图"""
+        rows = self.visible_rows()
+        if not rows:
+            return
+        first = max(0, rows.start - PRELOAD_ROWS)
+        last = min(self.count(), rows.stop + PRELOAD_ROWS)
+
+        keep = range(max(0, rows.start - KEEP_ROWS), rows.stop + KEEP_ROWS)
+        placeholder = None
+        for page_idx in [p for p in self.loaded if p not in keep]:
+            if placeholder is None:
+                placeholder = QIcon(self.placeholder)
+            self.item(page_idx).setIcon(placeholder)
+            self.loaded.discard(page_idx)
+
+        lookups = []
+        jobs = []
+        for page_idx in range(first, last):
+            if page_idx in self.loaded:
+                continue
+            if self.preview is not None:
+                data = self.preview.thumbnail(page_idx)
+                image = QImage.fromData(data, "PNG") if data else None
+                if image is not None and not image.isNull():
+                    self.show_thumbnail(page_idx, image)
+                    continue
+            # 离可见区域越近越先查找和渲染
+            distance = 0 if page_idx in rows else min(abs(page_idx - rows.start), abs(page_idx - rows.stop))
+            if self.doc_hash is not None and page_idx not in self.cache_misses:
+                lookups.append((distance, page_idx))
+                continue
+            if self.doc is None:
+                continue
+            zoom = THUMB_WIDTH / max(self.doc.load_page(page_idx).rect.width, 1)
+            jobs.append((distance, page_idx, zoom, None))
+        self.cache_worker.lookup(self.generation, self.doc_hash, [page_idx for _, page_idx in sorted(lookups)])
+        self.render_service.request(jobs)
+
+    def show_thumbnail(self, page_idx, image):
+        self.item(page_idx).setIcon(QIcon(QPixmap.fromImage(image)))
+        self.loaded.add(page_idx)
+
+    def on_thumbnail_loaded(self, generation, page_idx, image):
+        if generation != self.generation or page_idx >= self.count() or page_idx in self.loaded:
+            return
+        if image is not None:
+            self.show_thumbnail(page_idx, image)
+        else:
+            # 缓存中没有：下一轮更新时交给后台渲染
+            self.cache_misses.add(page_idx)
+            self.schedule_update()
+
+    def on_thumbnail_rendered(self, generation, page_idx, zoom, tile, image):
+        if generation != self.generation or self.doc is None or page_idx >= self.count():
+            return
+        self.show_thumbnail(page_idx, image)
+        if self.doc_hash is not None:
+            self.cache_worker.store(self.doc_hash, page_idx, image)
+
+    def shutdown(self):
+        self.render_service.shutdown()
+        self.cache_worker.shutdown()
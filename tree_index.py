@@ -0,0 +1,86 @@
+"""
+加密目录的文件树索引，由加密工具 generate_gui.py 生成，查看器 pdfviewer.py 读取。
+
+索引文件放在加密目录中，随加密文件一起打包分发。查看器启动时只读这一个文件就能建好目录树，
+不必逐个目录 listdir / isdir（打包成单文件 EXE 后目录位于临时解压目录中，文件很多时很慢）。
+
+文件格式：魔数（8字节）+ HMAC-SHA256（32字节）+ zlib 压缩的 JSON。
+HMAC 的密钥由容器密钥派生，索引被改动或与密钥不符时视为无效，查看器退回逐个目录遍历。
+
+JSON 为节点列表，保持与目录中名称排序一致：
+    目录：[名称, [子节点, ...]]
+    文件：[显示名称（去掉 .enc）, 原始PDF大小或None, 页数或None]
+"""
+import os
+import json
+import hmac
+import zlib
+import hashlib
+
+INDEX_FILE = "tree_index.bin"
+INDEX_MAGIC = b"PDFIDX1\n"
+DIGEST_SIZE = 32
+
+
+def _index_key(key):
+    """索引签名使用单独派生的密钥，不直接复用加密密钥"""
+    return hashlib.sha256(b"pdf-tree-index|" + key).digest()
+
+
+def get_index_path(enc_folder):
+    return os.path.join(enc_folder, INDEX_FILE)
+
+
+def scan_tree(enc_folder, file_info=None):
+    """遍历加密目录生成节点列表；file_info(相对路径) 返回 (大小, 页数)，相对路径不含 .enc、以 / 分隔"""
+
+    def scan(path, prefix):
+        nodes = []
+        for name in sorted(os.listdir(path)):
+            full_path = os.path.join(path, name)
+            if os.path.isdir(full_path):
+                nodes.append([name, scan(full_path, prefix + name + "/")])
+            elif name.lower().endswith(".enc"):
+                display_name = name[:-4] if name.endswith(".enc") else name
+                size, pages = file_info(prefix + display_name) if file_info is not None else (None, None)
+                nodes.append([display_name, size, pages])
+        return nodes
+
+    return scan(enc_folder, "")
+
+
+def write_index(enc_folder, key, nodes):
+    payload = zlib.compress(json.dumps(nodes, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+    digest = hmac.new(_index_key(key), INDEX_MAGIC + payload, hashlib.sha256).digest()
+    index_path = get_index_path(enc_folder)
+    tmp_path = index_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC + digest + payload)
+    os.replace(tmp_path, index_path)
+
+
+def load_index(enc_folder, key):
+    """读取并校验索引，返回节点列表；不存在、签名不符或已损坏时返回 None"""
+    index_path = get_index_path(enc_folder)
+    try:
+        with open(index_path, "rb") as f:
+            blob = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"目录索引无效: {index_path} ({str(e)})")
+        return None
+
+    header_size = len(INDEX_MAGIC) + DIGEST_SIZE
+    payload = blob[header_size:]
+    expected = hmac.new(_index_key(key), INDEX_MAGIC + payload, hashlib.sha256).digest()
+    if (len(blob) < header_size or blob[:len(INDEX_MAGIC)] != INDEX_MAGIC
+            or not hmac.compare_digest(blob[len(INDEX_MAGIC):header_size], expected)):
+        print(f"目录索引无效: {index_path} (签名校验失败)")
+        return None
+    try:
+        nodes = json.loads(zlib.decompress(payload).decode("utf-8"))
+    except (zlib.error, ValueError) as e:
+        print(f"目录索引无效: {index_path} ({str(e)})")
+        return None
+    return nodes if isinstance(nodes, list) else None
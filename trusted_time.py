@@ -0,0 +1,287 @@
+"""
+可信时间服务
+
+用 asyncio 同时向所有 NTP 服务器发出请求，只要有 quorum 个服务器给出的本地时钟偏差彼此一致
+（相差不超过 tolerance 秒）就采用它们的中位数，不再等待其余服务器。
+同步结果以“可信时间戳 + 当时的单调时钟”保存，之后的 now() 只读单调时钟，不访问网络，
+修改系统时间也不影响结果。
+
+服务器顺序可由 test_ntp.py 测试后写入的 ntp_servers.json 提供（load_server_list）。
+
+TrustedTimeService.start() 在后台线程中同步，立即返回，程序启动时不等待网络；同步完成之前 now() 返回 None，
+每次同步成功后调用 on_synced（在后台线程中），调用方据此重新做依赖时间的检查。同步失败时后台线程按间隔继续重试。
+服务器和端口都可配置，可以对着本机的模拟 NTP 服务测试（fake_ntp.py）。
+"""
+import asyncio
+import json
+import socket
+import statistics
+import struct
+import threading
+import time
+
+NTP_SERVERS = [
+    "cn.pool.ntp.org",
+    "ntp.tencent.com",
+    "time1.aliyun.com",
+    "ntp.aliyun.com",
+    "time2.aliyun.com"
+]
+NTP_PORT = 123
+NTP_PACKET_FORMAT = "!12I"
+NTP_DELTA = 2208988800  # 1970-01-01到1900-01-01的秒数
+NTP_TIMEOUT = 3.0  # 单次同步的总超时（秒），包括域名解析
+NTP_QUORUM = 2  # 至少几个服务器的结果一致才采用
+NTP_TOLERANCE = 1.0  # 结果一致的判定范围（秒）
+RESYNC_INTERVAL = 3600  # 同步结果使用多久后在后台重新同步（秒）
+RETRY_INTERVAL = 60  # 同步失败后多久重试（秒）
+NTP_SERVERS_FILE = "ntp_servers.json"  # test_ntp.py 生成的服务器列表（按丢包率和延迟排序）
+
+
+def to_ntp_time(timestamp):
+    """Unix 时间戳 -> (NTP 秒, NTP 秒的小数部分)"""
+    ntp_time = timestamp + NTP_DELTA
+    seconds = int(ntp_time)
+    return seconds, int((ntp_time - seconds) * 2 ** 32) & 0xFFFFFFFF
+
+
+def from_ntp_time(seconds, fraction):
+    return seconds + fraction / 2 ** 32 - NTP_DELTA
+
+
+def build_request(timestamp):
+    """客户端请求包（版本3，客户端模式），发送时间写在 Transmit Timestamp 中，服务器会原样带回"""
+    words = [0] * 12
+    words[0] = 0x1B << 24
+    words[10], words[11] = to_ntp_time(timestamp)
+    return struct.pack(NTP_PACKET_FORMAT, *words)
+
+
+def parse_response(data, request, sent, received):
+    """解析服务器响应，返回 (本地时钟偏差, 往返延迟)，单位秒；偏差为正表示本地时钟偏慢"""
+    if len(data) < 48:
+        raise ValueError("NTP响应长度不足")
+    words = struct.unpack(NTP_PACKET_FORMAT, data[:48])
+    mode = (words[0] >> 24) & 0x7
+    stratum = (words[0] >> 16) & 0xFF
+    if mode != 4 or stratum == 0:
+        raise ValueError("NTP响应无效")
+    if words[6:8] != struct.unpack(NTP_PACKET_FORMAT, request)[10:12]:
+        # 不是对本次请求的回复（过期或伪造的报文）
+        raise ValueError("NTP响应与请求不匹配")
+    server_received = from_ntp_time(words[8], words[9])
+    server_sent = from_ntp_time(words[10], words[11])
+    offset = ((server_received - sent) + (server_sent - received)) / 2
+    delay = (received - sent) - (server_sent - server_received)
+    return offset, delay
+
+
+class _NtpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, future):
+        self.future = future
+        self.request = None
+        self.sent = None
+
+    def connection_made(self, transport):
+        self.sent = time.time()
+        self.request = build_request(self.sent)
+        transport.sendto(self.request)
+
+    def datagram_received(self, data, addr):
+        received = time.time()
+        if self.future.done():
+            return
+        try:
+            self.future.set_result(parse_response(data, self.request, self.sent, received))
+        except ValueError:
+            # 忽略无效报文，继续等待正确的回复
+            pass
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+def server_address(server, port=NTP_PORT):
+    """服务器可以写成 "主机" 或 ("主机", 端口)"""
+    return tuple(server) if isinstance(server, (tuple, list)) else (server, port)
+
+
+def server_label(server, port=NTP_PORT):
+    host, server_port = server_address(server, port)
+    return host if server_port == NTP_PORT else f"{host}:{server_port}"
+
+
+def load_server_list(path, default=NTP_SERVERS):
+    """读取 test_ntp.py 生成的服务器列表，文件不存在或无效时返回 default"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)["servers"]
+        servers = [entry["host"] if entry.get("port", NTP_PORT) == NTP_PORT else (entry["host"], entry["port"])
+                   for entry in entries]
+    except FileNotFoundError:
+        return list(default)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"NTP服务器列表无效: {path} ({str(e)})")
+        return list(default)
+    return servers or list(default)
+
+
+async def query_server(server, port=NTP_PORT):
+    """向一个服务器请求一次，返回 (本地时钟偏差, 往返延迟)；由调用方控制超时，超时同样覆盖域名解析"""
+    loop = asyncio.get_running_loop()
+    host, server_port = server_address(server, port)
+    addresses = await loop.getaddrinfo(host, server_port, type=socket.SOCK_DGRAM)
+    if not addresses:
+        raise OSError(f"无法解析 {host}")
+    family, _, _, _, address = addresses[0]
+    future = loop.create_future()
+    transport, _ = await loop.create_datagram_endpoint(lambda: _NtpProtocol(future),
+                                                       remote_addr=address, family=family)
+    try:
+        return await future
+    finally:
+        transport.close()
+
+
+def find_quorum(answers, quorum, tolerance):
+    """在 [(服务器, 偏差, 延迟), ...] 中找 quorum 个偏差彼此相差不超过 tolerance 的结果"""
+    answers = sorted(answers, key=lambda answer: answer[1])
+    for i in range(len(answers) - quorum + 1):
+        group = answers[i:i + quorum]
+        if group[-1][1] - group[0][1] <= tolerance:
+            return group
+    return None
+
+
+async def query_quorum(servers, port=NTP_PORT, timeout=NTP_TIMEOUT, quorum=NTP_QUORUM, tolerance=NTP_TOLERANCE):
+    """同时请求所有服务器，达到法定数即返回 (本地时钟偏差, [一致的服务器])，超时仍未达到时返回 None"""
+    if not servers:
+        return None
+    quorum = max(1, min(quorum, len(servers)))
+
+    async def ask(server):
+        try:
+            offset, delay = await query_server(server, port)
+        except (OSError, ValueError):
+            return None
+        return server_label(server, port), offset, delay
+
+    tasks = [asyncio.ensure_future(ask(server)) for server in servers]
+    answers = []
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            answer = await next_done
+            if answer is None:
+                continue
+            answers.append(answer)
+            group = find_quorum(answers, quorum, tolerance)
+            if group is not None:
+                return statistics.median(offset for _, offset, _ in group), [label for label, _, _ in group]
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return None
+
+
+def run_quorum(servers, port=NTP_PORT, timeout=NTP_TIMEOUT, quorum=NTP_QUORUM, tolerance=NTP_TOLERANCE):
+    """在新的事件循环中执行 query_quorum，最多 timeout 秒后返回
+
+    不用 asyncio.run()：它在返回前会等待默认线程池中仍未结束的域名解析，解析卡住时超时就失效了。
+    loop.close() 关闭线程池时不等待，卡住的解析线程在后台自行结束。
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(query_quorum(servers, port, timeout, quorum, tolerance))
+    finally:
+        loop.close()
+
+
+class TrustedTimeService:
+    def __init__(self, servers=NTP_SERVERS, port=NTP_PORT, timeout=NTP_TIMEOUT, quorum=NTP_QUORUM,
+                 tolerance=NTP_TOLERANCE, fallback=None, resync_interval=RESYNC_INTERVAL,
+                 retry_interval=RETRY_INTERVAL, on_synced=None):
+        """fallback 为 NTP 失败时调用的函数（在后台线程中执行），返回 (UTC 时间戳, 来源) 或 None；
+        on_synced 为每次同步成功后调用的函数（在后台线程中执行，无参数）"""
+        self.servers = list(servers)
+        self.port = port
+        self.timeout = timeout
+        self.quorum = quorum
+        self.tolerance = tolerance
+        self.fallback = fallback
+        self.resync_interval = resync_interval
+        self.retry_interval = retry_interval
+        self.on_synced = on_synced
+        self._lock = threading.Lock()
+        self._base = None  # (可信时间戳, 对应的单调时钟, 来源)
+        self._thread = None
+        self._finished = threading.Event()  # 第一次同步已结束（无论成败）
+
+    def start(self):
+        """在后台线程中同步，立即返回；正在同步时不重复启动"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # 失败（如离线）时按间隔重试，直到成功
+        while not self.sync():
+            time.sleep(self.retry_interval)
+
+    def sync(self):
+        """同步一次（阻塞），成功返回 True"""
+        result = None
+        try:
+            result = run_quorum(self.servers, self.port, self.timeout, self.quorum, self.tolerance)
+        except Exception as e:
+            print(f"NTP同步失败: {str(e)}")
+        if result is not None:
+            offset, agreed = result
+            timestamp, source = time.time() + offset, f"NTP({', '.join(agreed)})"
+        else:
+            fetched = None
+            if self.fallback is not None:
+                try:
+                    fetched = self.fallback()
+                except Exception as e:
+                    print(f"备用时间获取失败: {str(e)}")
+            if fetched is None:
+                self._finished.set()
+                return False
+            timestamp, source = fetched
+        with self._lock:
+            self._base = (timestamp, time.monotonic(), source)
+        self._finished.set()
+        if self.on_synced is not None:
+            try:
+                self.on_synced()
+            except Exception as e:
+                print(f"同步回调失败: {str(e)}")
+        return True
+
+    def now(self):
+        """返回 (可信的 UTC 时间戳, 来源)，尚未同步成功时返回 (None, "")；不访问网络"""
+        with self._lock:
+            base = self._base
+        if base is None:
+            return None, ""
+        timestamp, monotonic_base, source = base
+        elapsed = time.monotonic() - monotonic_base
+        if elapsed > self.resync_interval:
+            # 后台线程在同步或失败后等待重试期间 start() 不会重复启动，不会每次调用都访问网络
+            self.start()
+        return timestamp + elapsed, source
+
+    @property
+    def finished(self):
+        """第一次同步是否已结束（无论成败）"""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """等待第一次同步结束（无论成败），返回是否已结束；供命令行工具和测试使用"""
+        return self._finished.wait(timeout)